@@ -0,0 +1,100 @@
+"""Approximate nearest-neighbour search over face encodings (pure NumPy IVF).
+
+The known encodings are clustered with k-means into `nlist` cells.  A query
+is only compared against the encodings in its `nprobe` closest cells, so
+lookup cost grows with roughly N * nprobe / nlist instead of N.  Raising
+`nprobe` trades latency for recall; nprobe == nlist is an exact search.
+
+IVFIndex objects are never modified after construction: with_added()
+returns a new index sharing all untouched cells, so a matching thread can
+keep searching the old one while a captured face is being added.
+"""
+import numpy as np
+
+_CHUNK = 16384
+
+
+def _sq_norms(x):
+    return np.einsum("ij,ij->i", x, x)
+
+
+def _nearest_centroid(x, centroids):
+    c_norms = _sq_norms(centroids)
+    assign = np.empty(len(x), dtype=np.int64)
+    # Chunked so 100k encodings x a few hundred centroids stays small in memory
+    for start in range(0, len(x), _CHUNK):
+        block = x[start:start + _CHUNK]
+        assign[start:start + _CHUNK] = np.argmin(c_norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+    return assign
+
+
+def _kmeans(x, k, iterations, rng):
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest_centroid(x, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        nonempty = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.add.reduceat(x[order], starts, axis=0)
+        # Empty cells keep their old centroid
+        centroids[nonempty] = sums / counts[nonempty, None]
+    return centroids
+
+
+class IVFIndex:
+    def __init__(self, matrix, nlist=None, nprobe=8, iterations=10, seed=0):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        n = len(matrix)
+        if n == 0:
+            raise ValueError("IVFIndex needs at least one encoding")
+        self.nlist = min(nlist or max(1, int(np.sqrt(n))), n)
+        self.nprobe = nprobe
+        self.trained_size = n
+        rng = np.random.default_rng(seed)
+        train = matrix if n <= 64 * self.nlist else matrix[rng.choice(n, 64 * self.nlist, replace=False)]
+        self.centroids = _kmeans(train, self.nlist, iterations, rng)
+        assign = _nearest_centroid(matrix, self.centroids)
+        self._ids = [np.flatnonzero(assign == c) for c in range(self.nlist)]
+        self._vectors = [matrix[ids] for ids in self._ids]
+        self._norms = [_sq_norms(v) for v in self._vectors]
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids)
+
+    def with_added(self, index, encoding):
+        """Return a copy of this index that also contains `encoding` as row `index`."""
+        vec = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+        c = int(_nearest_centroid(vec, self.centroids)[0])
+        new = object.__new__(IVFIndex)
+        new.__dict__.update(self.__dict__)
+        new._ids = list(self._ids)
+        new._vectors = list(self._vectors)
+        new._norms = list(self._norms)
+        new._ids[c] = np.append(self._ids[c], index)
+        new._vectors[c] = np.concatenate([self._vectors[c], vec])
+        new._norms[c] = np.append(self._norms[c], _sq_norms(vec))
+        return new
+
+    def search(self, queries, nprobe=None):
+        """Return (indices, distances) of the approximate nearest encoding per query."""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        q_norms = _sq_norms(queries)
+        cell_d2 = _sq_norms(self.centroids)[None, :] - 2.0 * (queries @ self.centroids.T)
+        probes = np.argpartition(cell_d2, nprobe - 1, axis=1)[:, :nprobe]
+
+        indices = np.full(len(queries), -1)
+        distances = np.full(len(queries), np.inf, dtype=np.float32)
+        for qi, cells in enumerate(probes):
+            cells = [c for c in cells if len(self._ids[c])]
+            if not cells:
+                continue
+            ids = np.concatenate([self._ids[c] for c in cells])
+            vectors = np.concatenate([self._vectors[c] for c in cells])
+            norms = np.concatenate([self._norms[c] for c in cells])
+            d2 = norms - 2.0 * (vectors @ queries[qi])
+            best = int(np.argmin(d2))
+            indices[qi] = ids[best]
+            distances[qi] = np.sqrt(max(d2[best] + q_norms[qi], 0.0))
+        return indices, distances
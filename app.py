@@ -1,46 +1,39 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, Label, Frame, simpledialog
-from PIL import Image, ImageTk
-import threading
-import time
 from ttkthemes import ThemedTk
 import face_recognition
-import numpy as np
 import os
 import datetime
+from face_index import KnownFaceIndex
+from encoding_cache import load_known_faces, add_known_face
+from pipeline import Pipeline
+from stream_client import MjpegClient, jpg_url_for
+from frame_buffers import freeze
+from tk_renderer import TkVideoRenderer, start_diagnostics
+from recognition import largest_faces
+from timing import StageTimer
+from scheduler import AdaptiveScheduler, HOG_LEVELS
+from motion import MotionGate
 
 # --- Face Recognition Setup ---
 # Update the file path to your face images directory.
 face_images_path = r"C:\Users\arsha\OneDrive\Desktop\new-bot\images"
-images = []
-classnames = []
-mylist = os.listdir(face_images_path)
-print("Image list:", mylist)
-
-for cl in mylist:
-    img_path = os.path.join(face_images_path, cl)
-    crimg = cv2.imread(img_path)
-    if crimg is None:
-        continue
-    images.append(crimg)
-    classnames.append(os.path.splitext(cl)[0])
-
+images = []  # Faces captured during this session
+classnames, encodings = load_known_faces(face_images_path)
+known_faces = KnownFaceIndex(classnames, encodings)
 print("Class names:", classnames)
 
-def find_encodings(images):
-    encodelist = []
-    for img in images:
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        try:
-            encode = face_recognition.face_encodings(img_rgb)[0]
-        except IndexError:
-            continue  # Skip images with no detectable face
-        encodelist.append(encode)
-    return encodelist
-
-encodelist_known = find_encodings(images)
-print("Encoding complete...")
+# Encode at most this many faces per frame (largest first); None encodes all.
+MAX_FACES_TO_ENCODE = None
+# Prints average detect / embed / match times every 100 frames (also exported to metrics).
+timer = StageTimer(every=100)
+# Adapts detection scale / frame skipping to keep up with TARGET_FPS.
+TARGET_FPS = 15
+scheduler = AdaptiveScheduler(HOG_LEVELS, target_fps=TARGET_FPS)
+last_faces = []  # Boxes from the last detection, redrawn on skipped frames
+faces_present = False  # Any face in the last detection, known or not
+motion = MotionGate()
 
 # --- End Face Recognition Setup ---
 
@@ -60,7 +53,6 @@ latest_frame = None
 
 # Function to capture a face from the current frame of the ESP32-CAM stream
 def capture_face():
-    global latest_frame, encodelist_known, classnames, images
     if latest_frame is None:
         status_label.config(text="Status: No frame available yet.")
         return
@@ -89,9 +81,9 @@ def capture_face():
     cv2.imwrite(file_path, latest_frame)
     
     # Update global lists
-    images.append(latest_frame.copy())
-    classnames.append(name.strip())
-    encodelist_known.append(new_encoding)
+    images.append(latest_frame)
+    known_faces.add(name.strip(), new_encoding)
+    add_known_face(face_images_path, filename, new_encoding)
     
     status_label.config(text=f"Status: Captured face for {name.strip()}")
     print(f"Captured face for {name.strip()} and saved to {file_path}")
@@ -139,61 +131,56 @@ status_label.pack(side=tk.BOTTOM, fill=tk.X)
 
 # Use your ESP32-CAM stream URL.
 esp32_cam_url = "http://192.168.1.8/mjpeg/1"  # Now using the root URL which serves the webpage & stream
-cap = cv2.VideoCapture(esp32_cam_url)
-
-def update_video():
-    global latest_frame
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Failed to read frame from stream.")
-            time.sleep(0.1)
-            continue
-
-        # Debug: Print frame dimensions
-        print("Frame shape:", frame.shape)
-        latest_frame = frame.copy()  # Update the latest frame for capture
-        
-        # --- Face Recognition Processing ---
-        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-        small_frame_rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(small_frame_rgb)
-        face_encodings = face_recognition.face_encodings(small_frame_rgb)
-        
-        # Debug: Print number of faces detected
-        print("Detected faces:", len(face_locations))
-        
-        for face_encoding, face_location in zip(face_encodings, face_locations):
-            matches = face_recognition.compare_faces(encodelist_known, face_encoding)
-            face_distances = face_recognition.face_distance(encodelist_known, face_encoding)
-            if len(face_distances) > 0:
-                match_index = np.argmin(face_distances)
-                if matches[match_index]:
-                    name = classnames[match_index].upper()
-                    top, right, bottom, left = face_location
-                    top *= 4
-                    right *= 4
-                    bottom *= 4
-                    left *= 4
-                    cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                    cv2.rectangle(frame, (left, bottom - 35), (right, bottom), (0, 255, 0), cv2.FILLED)
-                    cv2.putText(frame, name, (left + 6, bottom - 6),
-                                cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        # --- End Face Recognition Processing ---
-        
-        display_frame = cv2.resize(frame, (640, 480))
-        display_frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(display_frame_rgb)
-        imgtk = ImageTk.PhotoImage(image=img)
-        video_label.imgtk = imgtk  # Prevent garbage collection
-        video_label.configure(image=imgtk)
-        time.sleep(0.03)
-
-video_thread = threading.Thread(target=update_video, daemon=True)
-video_thread.start()
+stream_client = MjpegClient(esp32_cam_url, fallback_url=jpg_url_for(esp32_cam_url))
+
+def process_frame(packet):
+    global latest_frame, last_faces, faces_present
+    frame = packet.image
+    # Share the decoded frame read-only instead of copying it: nothing draws on it
+    latest_frame = freeze(frame)
+
+    # --- Face Recognition Processing ---
+    # The scheduler picks the detection scale and how many frames to skip
+    # from the measured processing time; skipped frames reuse the last boxes.
+    moving = motion.update(frame)
+    if (moving or faces_present) and scheduler.should_detect():
+        with scheduler.timed():
+            scale = scheduler.scale
+            small_frame = cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+            small_frame_rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            # Detect once and feed the same boxes to the encoder and the drawing code
+            with timer.stage("detect"):
+                face_locations = face_recognition.face_locations(small_frame_rgb)
+            faces_present = len(face_locations) > 0
+
+            face_locations = largest_faces(face_locations, MAX_FACES_TO_ENCODE)
+            with timer.stage("embed"):
+                face_encodings = face_recognition.face_encodings(small_frame_rgb, face_locations)
+
+            # Match every face in the frame against the known faces in one go
+            with timer.stage("match"):
+                names, _ = known_faces.match(face_encodings)
+            # Scale face locations back to the original frame size
+            last_faces = [tuple(int(v / scale) for v in face_location) + (name.upper(),)
+                          for name, face_location in zip(names, face_locations)
+                          if name is not None]
+    packet.faces.extend(last_faces)
+    # --- End Face Recognition Processing ---
+    timer.frame_done()
+    return packet
+
+renderer = TkVideoRenderer(root, video_label, style="banner").start()
+
+METRICS_PORT = 9108  # Prometheus /metrics, 0 = off
+overlay = start_diagnostics(root, video_label, METRICS_PORT)  # F12 dumps a trace
+
+pipeline = Pipeline(stream_client.frames, process=process_frame, render=renderer.submit).start()
 
 def on_closing():
-    cap.release()
+    stream_client.close()
+    pipeline.stop()
+    renderer.stop()
+    overlay.stop()
     root.destroy()
 
 root.protocol("WM_DELETE_WINDOW", on_closing)
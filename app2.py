@@ -1,17 +1,19 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, Label, Frame, simpledialog
-from PIL import Image, ImageTk
-import threading
-import time
 from ttkthemes import ThemedTk
-import numpy as np
 import os
 import datetime
-import requests
+from stream_client import MjpegClient, jpg_url_for
+from pipeline import Pipeline
+from tk_renderer import TkVideoRenderer, start_diagnostics
+import metrics
+from motion import MotionGate
 
 # --- Face Detection Setup using Haar Cascades ---
 face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+motion = MotionGate()
+last_faces = []  # Boxes from the last detection, reused while the scene is static
 face_images_path = r"C:\Users\arsha\OneDrive\Desktop\new-bot\images"
 if not os.path.exists(face_images_path):
     os.makedirs(face_images_path)
@@ -29,14 +31,14 @@ def send_command(command):
         # Actual Bluetooth/serial code would go here.
         pass
 
-# Global variable to store the latest frame for capture.
-latest_frame = None
+# Latest packet, for capture; its full frame is only decoded when a face is captured.
+latest_packet = None
 
 def capture_face():
-    global latest_frame, images, classnames
-    if latest_frame is None:
+    if latest_packet is None:
         status_label.config(text="Status: No frame available yet.")
         return
+    latest_frame = latest_packet.image
 
     gray = cv2.cvtColor(latest_frame, cv2.COLOR_BGR2GRAY)
     faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
@@ -108,45 +110,36 @@ status_label.pack(side=tk.BOTTOM, fill=tk.X)
 # Use your ESP32-CAM stream URL.
 stream_url = "http://192.168.1.8/mjpeg/1"  # Adjust if necessary
 
-def update_video():
-    global latest_frame
-    r = requests.get(stream_url, stream=True)
-    bytes_data = bytes()
-    for chunk in r.iter_content(chunk_size=1024):
-        bytes_data += chunk
-        a = bytes_data.find(b'\xff\xd8')
-        b = bytes_data.find(b'\xff\xd9')
-        if a != -1 and b != -1:
-            jpg = bytes_data[a:b+2]
-            bytes_data = bytes_data[b+2:]
-            data = np.frombuffer(jpg, dtype=np.uint8)
-            if data.size == 0:
-                continue  # Skip empty buffer
-            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
-            if frame is None:
-                continue
-            print("Frame shape:", frame.shape)
-            latest_frame = frame.copy()
-            
-            # Face detection using Haar Cascades
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+def process_frame(packet):
+    global latest_packet, last_faces
+    latest_packet = packet
+
+    # Face detection using Haar Cascades
+    # The decoder hands over a grayscale frame; no colour decode is needed here
+    gray = packet.gray
+    if motion.update(gray) or last_faces:
+        with metrics.stage("detect"):
             faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-            print("Detected faces:", len(faces))
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            
-            display_frame = cv2.resize(frame, (640, 480))
-            display_frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(display_frame_rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            video_label.imgtk = imgtk
-            video_label.configure(image=imgtk)
-            time.sleep(0.03)
-
-video_thread = threading.Thread(target=update_video, daemon=True)
-video_thread.start()
+        # Unnamed boxes; the renderer draws them at display size
+        last_faces = [(y, x+w, y+h, x, None) for (x, y, w, h) in faces]
+    packet.faces.extend(last_faces)
+    return packet
+
+renderer = TkVideoRenderer(root, video_label).start()
+
+METRICS_PORT = 9108  # Prometheus /metrics, 0 = off
+overlay = start_diagnostics(root, video_label, METRICS_PORT)  # F12 dumps a trace
+
+stream_client = MjpegClient(stream_url, fallback_url=jpg_url_for(stream_url))
+
+pipeline = Pipeline(stream_client.frames, process=process_frame, render=renderer.submit,
+                    gray_reduce=1).start()
 
 def on_closing():
+    stream_client.close()
+    pipeline.stop()
+    renderer.stop()
+    overlay.stop()
     root.destroy()
 
 root.protocol("WM_DELETE_WINDOW", on_closing)
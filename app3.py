@@ -1,52 +1,33 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, Label, Frame, simpledialog
-from PIL import Image, ImageTk
-import threading
-import time
 from ttkthemes import ThemedTk
 import face_recognition
-import numpy as np
 import os
 import datetime
-import requests
+from face_index import KnownFaceIndex
+from encoding_cache import load_known_faces, add_known_face
+from stream_client import MjpegClient, jpg_url_for
+from pipeline import Pipeline
+from tk_renderer import TkVideoRenderer, start_diagnostics
+import metrics
+from recognition import haar_to_locations, recognize_faces
+from motion import MotionGate
 
 # --- Known Face Recognition Setup ---
 # Update the file path to your known face images directory.
 known_faces_path = r"C:\Users\arsha\OneDrive\Desktop\new-bot\images"
-known_images = []
-classnames = []
-mylist = os.listdir(known_faces_path)
-print("Known image list:", mylist)
-
-for cl in mylist:
-    img_path = os.path.join(known_faces_path, cl)
-    crimg = cv2.imread(img_path)
-    if crimg is None:
-        continue
-    known_images.append(crimg)
-    classnames.append(os.path.splitext(cl)[0])
-
+known_images = []  # Faces captured during this session
+classnames, encodings = load_known_faces(known_faces_path)
+known_faces = KnownFaceIndex(classnames, encodings)
 print("Known class names:", classnames)
 
-def find_encodings(images):
-    encodelist = []
-    for img in images:
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        try:
-            encode = face_recognition.face_encodings(img_rgb)[0]
-        except IndexError:
-            continue  # Skip images with no detectable face
-        encodelist.append(encode)
-    return encodelist
-
-encodelist_known = find_encodings(known_images)
-print("Encoding complete...")
-
 # --- End Known Face Recognition Setup ---
 
 # Initialize Haar Cascade for face detection
 face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+motion = MotionGate()
+last_faces = []  # Results of the last detection, reused while the scene is static
 
 SIMULATION_MODE = True
 
@@ -58,14 +39,14 @@ def send_command(command):
         # Insert actual Bluetooth/serial command-sending code here.
         pass
 
-# Global variable to store the latest frame for capture.
-latest_frame = None
+# Latest packet, for capture; its full frame is only decoded when a face is captured.
+latest_packet = None
 
 def capture_face():
-    global latest_frame, known_images, classnames, encodelist_known
-    if latest_frame is None:
+    if latest_packet is None:
         status_label.config(text="Status: No frame available yet.")
         return
+    latest_frame = latest_packet.image
 
     # Convert latest frame to grayscale and detect faces using Haar cascade
     gray = cv2.cvtColor(latest_frame, cv2.COLOR_BGR2GRAY)
@@ -91,10 +72,10 @@ def capture_face():
     
     # Update the known faces lists
     known_images.append(face_img.copy())
-    classnames.append(name.strip())
     new_encoding = face_recognition.face_encodings(cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB))
     if new_encoding:
-        encodelist_known.append(new_encoding[0])
+        known_faces.add(name.strip(), new_encoding[0])
+        add_known_face(known_faces_path, filename, new_encoding[0])
     
     status_label.config(text=f"Status: Captured face for {name.strip()}")
     print(f"Captured face for {name.strip()} and saved to {file_path}")
@@ -142,63 +123,45 @@ status_label.pack(side=tk.BOTTOM, fill=tk.X)
 
 # Use your ESP32-CAM stream URL.
 stream_url = "http://192.168.1.8/mjpeg/1"  # Adjust if necessary
-# We'll use requests to read the MJPEG stream.
-def update_video():
-    global latest_frame
-    r = requests.get(stream_url, stream=True)
-    bytes_data = bytes()
-    for chunk in r.iter_content(chunk_size=1024):
-        bytes_data += chunk
-        a = bytes_data.find(b'\xff\xd8')
-        b = bytes_data.find(b'\xff\xd9')
-        if a != -1 and b != -1:
-            jpg = bytes_data[a:b+2]
-            bytes_data = bytes_data[b+2:]
-            data = np.frombuffer(jpg, dtype=np.uint8)
-            if data.size == 0:
-                continue
-            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
-            if frame is None:
-                continue
-            print("Frame shape:", frame.shape)
-            latest_frame = frame.copy()
-            
-            # --- Face Detection & Recognition ---
-            # First, use Haar Cascade to detect faces.
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+def process_frame(packet):
+    global latest_packet, last_faces
+    latest_packet = packet
+
+    # --- Face Detection & Recognition ---
+    # First, use Haar Cascade to detect faces.
+    # The decoder hands over a grayscale frame; the colour frame is only
+    # decoded if there is a face to encode.
+    gray = packet.gray
+    if motion.update(gray) or last_faces:
+        with metrics.stage("detect"):
             faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-            print("Detected faces:", len(faces))
-            for (x, y, w, h) in faces:
-                # Convert Haar detection coordinates to face_recognition format: (top, right, bottom, left)
-                top, right, bottom, left = y, x + w, y + h, x
-                # Get face encoding using the detected face location
-                face_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_encodings = face_recognition.face_encodings(face_rgb, [(top, right, bottom, left)])
-                name = "Unknown"
-                if face_encodings:
-                    encoding = face_encodings[0]
-                    matches = face_recognition.compare_faces(encodelist_known, encoding)
-                    face_distances = face_recognition.face_distance(encodelist_known, encoding)
-                    if len(face_distances) > 0:
-                        best_match_index = np.argmin(face_distances)
-                        if matches[best_match_index]:
-                            name = classnames[best_match_index].upper()
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                cv2.putText(frame, name, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255,255,255), 2)
-            # --- End Face Detection & Recognition ---
-            
-            display_frame = cv2.resize(frame, (640, 480))
-            display_frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(display_frame_rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            video_label.imgtk = imgtk  # Prevent garbage collection
-            video_label.configure(image=imgtk)
-            time.sleep(0.03)
-
-video_thread = threading.Thread(target=update_video, daemon=True)
-video_thread.start()
+        # One RGB conversion and one face_encodings() call for all faces in the frame
+        face_locations = haar_to_locations(faces)
+        last_faces = recognize_faces(lambda: packet.image, face_locations, known_faces)
+    for (top, right, bottom, left, name) in last_faces:
+        if name is None:
+            name = "Unknown"
+        else:
+            name = name.upper()
+        packet.faces.append((top, right, bottom, left, name))
+    # --- End Face Detection & Recognition ---
+    return packet
+
+renderer = TkVideoRenderer(root, video_label).start()
+
+METRICS_PORT = 9108  # Prometheus /metrics, 0 = off
+overlay = start_diagnostics(root, video_label, METRICS_PORT)  # F12 dumps a trace
+
+stream_client = MjpegClient(stream_url, fallback_url=jpg_url_for(stream_url))
+
+pipeline = Pipeline(stream_client.frames, process=process_frame, render=renderer.submit,
+                    gray_reduce=1).start()
 
 def on_closing():
+    stream_client.close()
+    pipeline.stop()
+    renderer.stop()
+    overlay.stop()
     root.destroy()
 
 root.protocol("WM_DELETE_WINDOW", on_closing)
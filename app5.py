@@ -1,84 +1,102 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, Label, Frame, simpledialog
-from PIL import Image, ImageTk
-import threading
-import time
 from ttkthemes import ThemedTk
 import face_recognition
-import numpy as np
 import os
 import datetime
-import requests
-import serial
+from face_index import KnownFaceIndex
+from encoding_cache import load_known_faces, add_known_face
+from stream_client import MjpegClient, jpg_url_for
+from pipeline import Pipeline
+from tk_renderer import TkVideoRenderer, start_diagnostics, TkTextSlot
+from recognition import StreamRecognizer
+from worker_pool import RecognitionPool
+from tracker import FaceTracker
+from scheduler import AdaptiveScheduler, HAAR_LEVELS
+from motion import MotionGate
+from command_dispatcher import CommandDispatcher
+from serial_link import SerialLink
+from recorder import Recorder
+from event_clips import EventBuffer
 
 # --- Bluetooth Setup ---
-# Adjust the COM port and baud rate as needed.
-try:
-    ser = serial.Serial("COM7", 9600, timeout=1)
-    print("Bluetooth serial connection established.")
-except Exception as e:
-    print("Bluetooth Serial Error:", e)
-    ser = None
+# Adjust the COM port and baud rate as needed.  The link opens the port in
+# the background and reopens it whenever the Bluetooth connection drops.
+# Started below, once the recognition workers exist.
+link = SerialLink("COM7", 9600)
 
 # --- Known Face Recognition Setup ---
 # Update the file path to your known face images directory.
 known_faces_path = r"C:\Users\arsha\OneDrive\Desktop\new-bot\images"
-known_images = []
-classnames = []
-mylist = os.listdir(known_faces_path)
-print("Known image list:", mylist)
-
-for cl in mylist:
-    img_path = os.path.join(known_faces_path, cl)
-    crimg = cv2.imread(img_path)
-    if crimg is None:
-        continue
-    known_images.append(crimg)
-    classnames.append(os.path.splitext(cl)[0])
-
+known_images = []  # Faces captured during this session
+classnames, encodings = load_known_faces(known_faces_path)
+# Set to e.g. 16 to search large galleries of enrolled visitors with the
+# approximate IVF index; it can miss a known face (recall next to
+# face_index.IVF_MIN_SIZE), so None keeps the exact search.
+IVF_NPROBE = None
+known_faces = KnownFaceIndex(classnames, encodings,
+                             backend="exact" if IVF_NPROBE is None else "auto",
+                             nprobe=IVF_NPROBE or 8)
 print("Known class names:", classnames)
 
-def find_encodings(images):
-    encodelist = []
-    for img in images:
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        try:
-            encode = face_recognition.face_encodings(img_rgb)[0]
-        except IndexError:
-            continue  # Skip images with no detectable face
-        encodelist.append(encode)
-    return encodelist
-
-encodelist_known = find_encodings(known_images)
-print("Encoding complete...")
-
 # --- End Known Face Recognition Setup ---
 
 # Initialize Haar Cascade for face detection
 face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
 
+# Track faces between detections so identities are re-embedded only every
+# REEMBED_EVERY detections instead of on every one.  A known face whose
+# Open is not cooling down is always re-embedded first, in case someone
+# else stepped into its box.
+REEMBED_EVERY = 15
+tracker = FaceTracker(reembed_every=REEMBED_EVERY)
+# Adapts detection resolution, frame skipping and cascade parameters to keep
+# up with TARGET_FPS.
+TARGET_FPS = 15
+scheduler = AdaptiveScheduler(HAAR_LEVELS, target_fps=TARGET_FPS)
+motion = MotionGate()
+
+# Number of worker processes computing face embeddings; 0 keeps recognition
+# on the video thread.  Workers are forked before this script starts any
+# thread (serial link, command writer, GUI): forking a process with running
+# threads can leave locks held in the children.  On Windows they are
+# spawned and would re-run this script, so leave it at 0.
+RECOGNITION_WORKERS = 0
+recognition_pool = None
+if RECOGNITION_WORKERS > 0:
+    recognition_pool = RecognitionPool(workers=RECOGNITION_WORKERS)
+link.start()
+
 # Set SIMULATION_MODE to False to use Bluetooth communication.
 SIMULATION_MODE = False
 
-def send_command(command):
-    # Send the command via Bluetooth if available.
-    if ser is not None:
-        try:
-            ser.write((command + "\n").encode('utf-8'))
-        except Exception as e:
-            print("Error sending command:", e)
+def write_command(command):
+    # Runs on the dispatcher's writer thread; the link batches and sends it
+    link.write(command + "\n")
     print(f"Sent command: {command}")
-    status_label.config(text=f"Status: {command}")
 
-# Global variable to store the latest frame for capture.
-latest_frame = None
+# Seconds between two "Open" commands for the same recognized person.
+OPEN_COOLDOWN = 5.0
+# Commands go through one writer thread that drops duplicates and keeps
+# "Stop" ahead of everything else, so the 9600-baud link never backs up.
+dispatcher = CommandDispatcher(write_command, cooldowns={"Open": OPEN_COOLDOWN})
+
+def send_command(command, key=None):
+    if dispatcher.send(command, key):
+        # Also called from the pipeline thread (Open): the main loop shows it
+        status.set(f"Status: {command}")
+        return True
+    return False
+
+# Latest packet, for capture; its full frame is only decoded when a face is captured.
+latest_packet = None
 
 def capture_face():
-    global latest_frame, known_images, classnames, encodelist_known
-    if latest_frame is None:
+    if latest_packet is None:
         status_label.config(text="Status: No frame available yet.")
         return
+    latest_frame = latest_packet.image
 
     # Convert latest frame to grayscale and detect faces using Haar cascade
     gray = cv2.cvtColor(latest_frame, cv2.COLOR_BGR2GRAY)
@@ -104,10 +122,10 @@ def capture_face():
     
     # Update the known faces lists
     known_images.append(face_img.copy())
-    classnames.append(name.strip())
     new_encoding = face_recognition.face_encodings(cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB))
     if new_encoding:
-        encodelist_known.append(new_encoding[0])
+        known_faces.add(name.strip(), new_encoding[0])
+        add_known_face(known_faces_path, filename, new_encoding[0])
     
     status_label.config(text=f"Status: Captured face for {name.strip()}")
     print(f"Captured face for {name.strip()} and saved to {file_path}")
@@ -152,70 +170,69 @@ ttk.Button(control_frame, text="Capture Face", width=15, command=capture_face, s
 status_label = Label(root, text="Status: Idle", bd=1, relief=tk.SUNKEN,
                      anchor=tk.W, font=("Helvetica", 10), bg="#34495e", fg="white")
 status_label.pack(side=tk.BOTTOM, fill=tk.X)
+status = TkTextSlot(status_label).start()
 
 # Use your ESP32-CAM stream URL.
 stream_url = "http://192.168.1.8/mjpeg/1"  # Adjust if necessary
 
-# We'll use requests to read the MJPEG stream.
-def update_video():
-    global latest_frame
-    r = requests.get(stream_url, stream=True)
-    bytes_data = bytes()
-    for chunk in r.iter_content(chunk_size=1024):
-        bytes_data += chunk
-        a = bytes_data.find(b'\xff\xd8')
-        b = bytes_data.find(b'\xff\xd9')
-        if a != -1 and b != -1:
-            jpg = bytes_data[a:b+2]
-            bytes_data = bytes_data[b+2:]
-            data = np.frombuffer(jpg, dtype=np.uint8)
-            if data.size == 0:
-                continue
-            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
-            if frame is None:
-                continue
-            latest_frame = frame.copy()
-            
-            # --- Face Detection & Recognition ---
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-            recognized = False  # Flag to check if at least one face is recognized
-            for (x, y, w, h) in faces:
-                # Convert Haar detection coordinates to face_recognition format: (top, right, bottom, left)
-                top, right, bottom, left = y, x+w, y+h, x
-                face_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_encodings = face_recognition.face_encodings(face_rgb, [(top, right, bottom, left)])
-                name = "Unknown"
-                if face_encodings:
-                    encoding = face_encodings[0]
-                    matches = face_recognition.compare_faces(encodelist_known, encoding)
-                    face_distances = face_recognition.face_distance(encodelist_known, encoding)
-                    if len(face_distances) > 0:
-                        best_match_index = np.argmin(face_distances)
-                        if matches[best_match_index]:
-                            name = classnames[best_match_index].upper()
-                            recognized = True  # A recognized face is found
-                cv2.rectangle(frame, (x, y), (x+w, y+h), (0, 255, 0), 2)
-                cv2.putText(frame, name, (x, y-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255,255,255), 2)
-            # If a recognized face is found, send the "Open" command via Bluetooth
-            if recognized:
-                send_command("Open")
-            # --- End Face Detection & Recognition ---
-            
-            display_frame = cv2.resize(frame, (640, 480))
-            display_frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(display_frame_rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            video_label.imgtk = imgtk  # Prevent garbage collection
-            video_label.configure(image=imgtk)
-            time.sleep(0.03)
-
-video_thread = threading.Thread(target=update_video, daemon=True)
-video_thread.start()
+def process_frame(packet):
+    global latest_packet
+    latest_packet = packet
+    # Sends "Open" for every recognized face, at most once per OPEN_COOLDOWN
+    # seconds for each person
+    return recognizer.process(packet)
+
+renderer = TkVideoRenderer(root, video_label).start()
+
+METRICS_PORT = 9108  # Prometheus /metrics, 0 = off
+overlay = start_diagnostics(root, video_label, METRICS_PORT)  # F12 dumps a trace
+
+stream_client = MjpegClient(stream_url, fallback_url=jpg_url_for(stream_url))
+
+# Set RECORD_DIR to keep the raw camera stream on disk: 5-minute segments,
+# oldest deleted beyond RECORD_MAX_GB.  Browse with `python recorder.py DIR`.
+RECORD_DIR = None
+RECORD_MAX_GB = 20
+source = stream_client.frames
+recorder = None
+if RECORD_DIR:
+    recorder = Recorder(RECORD_DIR, max_bytes=RECORD_MAX_GB * 2**30)
+    source = recorder.tee(source)
+# Set EVENTS_DIR to keep the last few seconds of frames in memory; every
+# recognized and every unknown face saves them plus the seconds after as a
+# clip there.
+EVENTS_DIR = None
+events = None
+if EVENTS_DIR:
+    events = EventBuffer(EVENTS_DIR, pre_seconds=5.0, post_seconds=5.0)
+    source = events.tee(source)
+
+recognizer = StreamRecognizer(face_cascade, known_faces, scheduler, tracker, motion, send_command,
+                              would_open=lambda name: not dispatcher.cooling_down("Open", name),
+                              events=events, pool=recognition_pool)
+
+# The decoder only produces the grayscale frame detection needs, already
+# reduced towards the scheduler's scale.
+pipeline = Pipeline(source, process=process_frame, render=renderer.submit,
+                    gray_reduce=scheduler.gray_reduce).start()
 
 def on_closing():
-    if ser is not None:
-        ser.close()  # Close the Bluetooth connection if open
+    stream_client.close()
+    pipeline.stop()
+    renderer.stop()
+    overlay.stop()
+    status.stop()
+    if recorder is not None:
+        recorder.close()
+    if events is not None:
+        events.close()
+        print("Event clips:", events.stats())
+    if recognition_pool is not None:
+        recognition_pool.close()
+    dispatcher.close()
+    print("Command link:", dispatcher.stats())
+    link.close()  # Close the Bluetooth connection
+    print("Serial link:", link.stats())
     root.destroy()
 
 root.protocol("WM_DELETE_WINDOW", on_closing)
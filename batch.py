@@ -0,0 +1,219 @@
+"""Offline face detection and recognition over recorded footage.
+
+    python cli-app.py --input footage.mp4 recordings/ snapshots/ --output faces.jsonl
+
+run_batch() accepts video files, .mjpeg captures (recorder.py segments use
+their .idx timestamps) and directories of images, cuts them into chunks of
+frames and processes the chunks on a process pool with every core busy.
+Each worker runs the live loop's Haar detection and face_recognition
+embedding on full-resolution frames -- only frames with a face are decoded
+in colour -- and results come back in input order as JSON Lines:
+
+    {"source": "footage.mp4", "frame": 1234, "timestamp": 41.13,
+     "faces": [{"box": [top, right, bottom, left], "name": "ALICE", "distance": 0.41}]}
+
+timestamp is seconds from the start of a video, and epoch seconds for
+recorded segments and images (file modification time).  Videos are read
+front to back by the calling process and their decoded frames sent to the
+workers: seeking lands on a nearby keyframe while OpenCV reports the
+requested position, so chunks read by seeking would overlap or miss frames.
+"""
+import collections
+import glob
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import cv2
+import face_recognition
+import numpy as np
+
+from face_index import KnownFaceIndex
+from mjpeg_parser import MjpegParser
+from recognition import haar_to_locations
+from recorder import Segment
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+MJPEG_EXTENSIONS = (".mjpeg", ".mjpg")
+CASCADE = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+
+_cascade = None
+_known_faces = None
+
+
+def _init_worker(classnames, encodings, tolerance, backend, nprobe):
+    global _cascade, _known_faces
+    _cascade = cv2.CascadeClassifier(CASCADE)
+    _known_faces = KnownFaceIndex(classnames, encodings, tolerance=tolerance, backend=backend,
+                                  nprobe=nprobe)
+
+
+def _recognize(gray, color):
+    """Faces of one frame as result dicts; `color` is a callable decoding the BGR frame.
+
+    Returns None if the frame has faces but `color` cannot decode it.
+    """
+    faces = _cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+    locations = haar_to_locations(faces)
+    if not locations:
+        return []
+    bgr = color()
+    if bgr is None:
+        return None
+    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    encodings = face_recognition.face_encodings(rgb, locations)
+    if len(_known_faces.classnames):
+        names, distances = _known_faces.match(encodings)
+        distances = [float(d) for d in distances]
+    else:
+        names, distances = [None] * len(encodings), [None] * len(encodings)
+    return [{"box": list(location), "name": name.upper() if name else None, "distance": distance}
+            for location, name, distance in zip(locations, names, distances)]
+
+
+def _process_jpegs(frames):
+    """`frames` is a list of (source, frame index, timestamp, encoded image)."""
+    results = []
+    for source, index, timestamp, jpeg in frames:
+        data = np.frombuffer(jpeg, dtype=np.uint8)
+        gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            continue
+        faces = _recognize(gray, lambda: cv2.imdecode(data, cv2.IMREAD_COLOR))
+        if faces is None:
+            continue
+        results.append({"source": source, "frame": index, "timestamp": timestamp,
+                        "faces": faces})
+    return results
+
+
+def _process_frames(frames):
+    """`frames` is a list of (source, frame index, timestamp, BGR image)."""
+    results = []
+    for source, index, timestamp, frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        results.append({"source": source, "frame": index, "timestamp": timestamp,
+                        "faces": _recognize(gray, lambda: frame)})
+    return results
+
+
+def _process_task(task):
+    kind = task[0]
+    if kind == "frames":
+        return _process_frames(task[1])
+    if kind == "images":
+        frames = []
+        for index, path in task[1]:
+            with open(path, "rb") as f:
+                frames.append((path, index, os.path.getmtime(path), f.read()))
+        return _process_jpegs(frames)
+    return _process_jpegs(task[1])
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _mjpeg_frames(path):
+    parser = MjpegParser()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            yield from parser.feed(block)
+
+
+def iter_tasks(inputs, chunk=32):
+    """Split the inputs into chunks of about `chunk` frames for the workers."""
+    for path in inputs:
+        if os.path.isdir(path):
+            images = sorted(p for p in glob.glob(os.path.join(path, "*"))
+                            if p.lower().endswith(IMAGE_EXTENSIONS))
+            for part in _chunks(list(enumerate(images)), chunk):
+                yield ("images", part)
+        elif path.lower().endswith(MJPEG_EXTENSIONS):
+            if os.path.exists(os.path.splitext(path)[0] + ".idx"):
+                frames = Segment(path).frames()
+            else:
+                frames = ((None, frame) for frame in _mjpeg_frames(path))
+            part = []
+            for index, (timestamp, jpeg) in enumerate(frames):
+                part.append((path, index, timestamp, bytes(jpeg)))
+                if len(part) == chunk:
+                    yield ("jpegs", part)
+                    part = []
+            if part:
+                yield ("jpegs", part)
+        else:
+            cap = cv2.VideoCapture(path)
+            if not cap.isOpened():
+                print(f"Cannot open {path}", file=sys.stderr)
+                continue
+            part = []
+            index = 0
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                timestamp = round(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, 3)
+                part.append((path, index, timestamp, frame))
+                index += 1
+                if len(part) == chunk:
+                    yield ("frames", part)
+                    part = []
+            cap.release()
+            if part:
+                yield ("frames", part)
+
+
+def _ordered(pool, tasks, depth):
+    """Results of `tasks` in order, with at most `depth` chunks in flight.
+
+    Pool.imap() would read every task up front, i.e. a whole day of JPEGs.
+    """
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(pool.apply_async(_process_task, (task,)))
+        if len(pending) >= depth:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def run_batch(inputs, known_faces, output=sys.stdout, workers=None, chunk=32, report_every=5.0):
+    """Process every frame of `inputs`, writing one JSON line per frame to `output`.
+
+    Returns {"frames", "faces", "seconds", "fps"}; progress goes to stderr.
+    """
+    workers = workers or os.cpu_count() or 1
+    initargs = (list(known_faces.classnames), known_faces.encodings, known_faces.tolerance,
+                known_faces.backend, known_faces.nprobe)
+    pool = None
+    if workers > 1:
+        # Fork where available: workers inherit the loaded modules
+        method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        pool = mp.get_context(method).Pool(workers, initializer=_init_worker, initargs=initargs)
+        results = _ordered(pool, iter_tasks(inputs, chunk), 2 * workers)
+    else:
+        _init_worker(*initargs)
+        results = map(_process_task, iter_tasks(inputs, chunk))
+    start = last_report = time.monotonic()
+    frames = faces = 0
+    try:
+        for chunk_results in results:
+            for result in chunk_results:
+                output.write(json.dumps(result) + "\n")
+                frames += 1
+                faces += len(result["faces"])
+            now = time.monotonic()
+            if report_every and now - last_report >= report_every:
+                last_report = now
+                print(f"[batch] {frames} frames, {frames / (now - start):.1f} frames/s",
+                      file=sys.stderr)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    seconds = time.monotonic() - start
+    return {"frames": frames, "faces": faces, "seconds": seconds,
+            "fps": frames / seconds if seconds else 0.0}
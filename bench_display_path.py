@@ -0,0 +1,96 @@
+"""Benchmark: bytes allocated per displayed frame, old display path vs TkVideoRenderer.
+
+    python bench_display_path.py --size 1600x1200 --frames 200
+
+The old path is what process_frame/render did before: copy the frame for
+capture, draw on it, resize it and convert it to RGB into new arrays.  The
+new path shares the frame read-only and lets the renderer draw, resize and
+convert into its preallocated buffers.  NumPy (and so OpenCV's output
+arrays) report to tracemalloc; PIL's own buffers are not counted.
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from frame_buffers import freeze
+from pipeline import FramePacket
+from tk_renderer import TkVideoRenderer
+
+FACES = [(100, 300, 300, 100, "ELON"), (150, 700, 350, 500, None)]
+
+
+class _NoTk:
+    """Stands in for the Tk root; the benchmark drives the ticks itself."""
+    def after(self, ms, func):
+        return None
+
+
+def old_path(frame):
+    latest_frame = frame.copy()
+    for (top, right, bottom, left, name) in FACES:
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+    display = cv2.resize(frame, (640, 480))
+    display = cv2.cvtColor(display, cv2.COLOR_BGR2RGB)
+    img = Image.fromarray(display)
+    return latest_frame, img
+
+
+def new_path(renderer, frame):
+    latest_frame = freeze(frame)
+    packet = FramePacket(0, image=frame)
+    packet.faces.extend(FACES)
+    renderer.submit(packet)
+    # What _tick does minus the PhotoImage paste
+    rgba, renderer._slot = renderer._slot, None
+    img = Image.frombuffer("RGBA", renderer.size, rgba, "raw", "RGBA", 0, 1)
+    del img
+    renderer.buffers.release(rgba)
+    return latest_frame
+
+
+def measure(step, frames):
+    step()
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    allocated = 0
+    for _ in range(frames):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        step()
+        # Peak above the starting point = bytes that were live inside the step
+        allocated += tracemalloc.get_traced_memory()[1] - before
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return allocated / frames, elapsed / frames
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark display-path allocations")
+    ap.add_argument("--size", default="1600x1200", help="Source frame WxH")
+    ap.add_argument("--frames", type=int, default=200)
+    args = ap.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+    # Frames arrive freshly decoded; build them outside the measured step
+    frames = [np.random.default_rng(i).integers(0, 255, (height, width, 3), dtype=np.uint8)
+              for i in range(4)]
+    cycle = iter(range(1 << 30))
+
+    old_bytes, old_time = measure(lambda: old_path(frames[next(cycle) % 4].copy()), args.frames)
+    renderer = TkVideoRenderer(_NoTk(), None)
+    new_bytes, new_time = measure(lambda: new_path(renderer, frames[next(cycle) % 4].copy()),
+                                  args.frames)
+    copy_bytes, _ = measure(lambda: frames[next(cycle) % 4].copy(), args.frames)
+
+    print(f"{width}x{height} -> 640x480, {args.frames} frames (input copy excluded)")
+    print(f"  old path: {(old_bytes - copy_bytes) / 1024:9.1f} KiB/frame  {old_time * 1000:6.2f} ms")
+    print(f"  new path: {(new_bytes - copy_bytes) / 1024:9.1f} KiB/frame  {new_time * 1000:6.2f} ms")
+    print(f"  renderer buffers: {renderer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
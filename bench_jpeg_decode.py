@@ -0,0 +1,69 @@
+"""Benchmark: decode cost per frame, full colour decode vs reduced grayscale.
+
+    python bench_jpeg_decode.py --size 1600x1200
+
+The old decoder stage ran cv2.imdecode(IMREAD_COLOR) and the processor then
+converted to gray and shrank the frame.  With Pipeline(gray_reduce=N) the
+JPEG decoder produces the reduced grayscale frame directly and the colour
+frame is only decoded when a face has to be encoded (or, at reduced size,
+for display).  The JPEG is images/*.jpg scaled up to --size.
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from pipeline import COLOR_DECODE, GRAY_DECODE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def timeit(func, min_time=0.5):
+    func()
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / runs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark reduced JPEG decoding")
+    ap.add_argument("--size", default="1600x1200", help="Frame WxH")
+    ap.add_argument("--quality", type=int, default=80)
+    args = ap.parse_args()
+    width, height = (int(v) for v in args.size.split("x"))
+    source = cv2.imread(sorted(glob.glob(os.path.join(HERE, "images", "*.jpg")))[0])
+    frame = cv2.resize(source, (width, height))
+    data = np.frombuffer(cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, args.quality])[1],
+                         dtype=np.uint8)
+
+    def legacy(scale):
+        image = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if scale != 1:
+            gray = cv2.resize(gray, (0, 0), fx=1.0 / scale, fy=1.0 / scale,
+                              interpolation=cv2.INTER_AREA)
+        return gray
+
+    print(f"{width}x{height} JPEG, {data.size / 1024:.0f} KiB")
+    for reduce, flags in sorted(GRAY_DECODE.items()):
+        old = timeit(lambda: legacy(reduce))
+        new = timeit(lambda: cv2.imdecode(data, flags))
+        print(f"  gray 1/{reduce}: colour+convert {old * 1000:6.2f} ms  "
+              f"reduced decode {new * 1000:6.2f} ms  speedup {old / new:4.1f}x")
+    full = timeit(lambda: cv2.imdecode(data, cv2.IMREAD_COLOR))
+    for reduce, flags in sorted(COLOR_DECODE.items()):
+        t = timeit(lambda: cv2.imdecode(data, flags))
+        print(f"  colour 1/{reduce} (display preview): {t * 1000:6.2f} ms  "
+              f"vs full {full * 1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
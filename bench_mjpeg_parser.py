@@ -0,0 +1,90 @@
+"""Throughput benchmark: legacy `bytes_data += chunk` loop vs MjpegParser.
+
+Record a capture from the robot with
+
+    curl http://192.168.1.8/mjpeg/1 --max-time 30 -o capture.mjpeg
+
+and run
+
+    python bench_mjpeg_parser.py capture.mjpeg
+
+Without arguments a stream is synthesised from images/*.jpg using the
+firmware's framing, once as-is and once padded to UXGA-sized frames.
+"""
+import argparse
+import glob
+import os
+import time
+
+from mjpeg_parser import MjpegParser, encode_part, stream_preamble
+
+
+def legacy_frames(chunks):
+    # The loop from app2.py - app5.py / cli-app.py, minus the decode.
+    bytes_data = bytes()
+    for chunk in chunks:
+        bytes_data += chunk
+        a = bytes_data.find(b'\xff\xd8')
+        b = bytes_data.find(b'\xff\xd9')
+        if a != -1 and b != -1:
+            jpg = bytes_data[a:b+2]
+            bytes_data = bytes_data[b+2:]
+            yield jpg
+
+
+def parser_frames(chunks):
+    return MjpegParser().iter_frames(chunks)
+
+
+def synthetic_stream(pad_to=0, repeat=200):
+    jpegs = []
+    for path in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "*.jpg"))):
+        with open(path, "rb") as f:
+            jpeg = f.read()
+        if pad_to > len(jpeg):
+            # Pad with zeros before EOI; they can never form a marker.
+            body = jpeg[:-2] + b"\x00" * (pad_to - len(jpeg))
+            jpeg = body + b"\xff\xd9"
+        jpegs.append(jpeg)
+    if not jpegs:
+        raise SystemExit("No images/*.jpg found to synthesise a stream from.")
+    parts = [encode_part(jpegs[i % len(jpegs)]) for i in range(repeat)]
+    return stream_preamble() + b"".join(parts)
+
+
+def run(name, stream, chunk_size, func):
+    chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+    start = time.perf_counter()
+    frames = 0
+    for _ in func(chunks):
+        frames += 1
+    elapsed = time.perf_counter() - start
+    mb = len(stream) / 1e6
+    print(f"  {name:8s} {frames:6d} frames  {elapsed * 1000:9.1f} ms  "
+          f"{mb / elapsed:8.1f} MB/s  {frames / elapsed:9.1f} frames/s")
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark MJPEG stream parsing")
+    ap.add_argument("captures", nargs="*", help="Raw multipart captures (curl -o)")
+    ap.add_argument("--chunk-size", type=int, default=1024)
+    args = ap.parse_args()
+
+    streams = []
+    for path in args.captures:
+        with open(path, "rb") as f:
+            streams.append((path, f.read()))
+    if not streams:
+        streams.append(("synthetic (images/)", synthetic_stream()))
+        streams.append(("synthetic UXGA-sized", synthetic_stream(pad_to=400 * 1024, repeat=50)))
+
+    for name, stream in streams:
+        print(f"{name}: {len(stream) / 1e6:.1f} MB, chunk_size={args.chunk_size}")
+        old = run("legacy", stream, args.chunk_size, legacy_frames)
+        new = run("parser", stream, args.chunk_size, parser_frames)
+        print(f"  speedup  {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""End-to-end benchmark of the video loop variants against a fake ESP32-CAM.
+
+    python bench_pipeline.py --size 800x600 --fps 20 --seconds 10
+
+Starts a FakeCamera (fake_esp32.py) replaying images/*.jpg placed on a
+canvas of --size, then runs each variant against it for --seconds:
+
+    legacy    one thread: requests + `bytes_data +=` loop, full colour
+              decode, full-resolution Haar, face_encodings for every face
+    pipeline  threaded Pipeline, colour decode, full-resolution Haar and
+              batched recognize_faces()
+    tuned     reduced grayscale decode, adaptive scheduler, motion gate and
+              IoU tracker, as in app4.py / cli-app.py
+
+and reports processed frames/s, detection and recognition time per frame
+and glass-to-result latency (frame sent by the server -> result ready).
+
+`python stream_client.py` checks MjpegClient's recovery paths against the
+same fake camera.
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+import requests
+
+from bench_mjpeg_parser import legacy_frames
+from encoding_cache import encode_image
+from face_index import KnownFaceIndex
+from fake_esp32 import FakeCamera, parse_size
+from motion import MotionGate
+from pipeline import Pipeline
+from recognition import haar_to_locations, recognize_faces, recognize_tracked
+from scheduler import AdaptiveScheduler, HAAR_LEVELS
+from stream_client import MjpegClient
+from timing import StageTimer
+from tracker import FaceTracker
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CASCADE = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+
+
+def make_frames(size, quality=80):
+    """Every images/*.jpg pasted onto a gray canvas of `size`, as JPEG."""
+    width, height = size
+    frames = []
+    for path in sorted(glob.glob(os.path.join(HERE, "images", "*.jpg"))):
+        face = cv2.imread(path)
+        scale = min(width / 2 / face.shape[1], height / 2 / face.shape[0])
+        face = cv2.resize(face, (0, 0), fx=scale, fy=scale)
+        canvas = np.full((height, width, 3), 90, dtype=np.uint8)
+        y, x = (height - face.shape[0]) // 2, (width - face.shape[1]) // 2
+        canvas[y:y + face.shape[0], x:x + face.shape[1]] = face
+        frames.append(cv2.imencode(".jpg", canvas, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+    return frames
+
+
+def known_faces_from_images():
+    names, encodings = [], []
+    for path in sorted(glob.glob(os.path.join(HERE, "images", "*.jpg"))):
+        encoding = encode_image(path)
+        if encoding is not None:
+            names.append(os.path.splitext(os.path.basename(path))[0])
+            encodings.append(encoding)
+    return KnownFaceIndex(names, np.array(encodings) if encodings else None)
+
+
+class Result:
+    def __init__(self, camera):
+        self.camera = camera
+        # Its stages wrap code that already records into metrics
+        self.timer = StageTimer(every=0, export=False)
+        self.latencies = []
+        self.frames = 0
+        self.start = time.monotonic()
+
+    def done(self, seq):
+        """Frame `seq` (1-based, on the newest connection) has its result."""
+        now = time.monotonic()
+        sent_at = self.camera.sent_at[-1]
+        if seq <= len(sent_at):
+            self.latencies.append(now - sent_at[seq - 1])
+        self.frames += 1
+
+    def report(self, name):
+        elapsed = time.monotonic() - self.start
+        stages = self.timer.summary()
+        detect = stages.get("detect", {}).get("avg_ms", 0.0)
+        recognize = stages.get("recognize", {}).get("avg_ms", 0.0)
+        lat = np.array(self.latencies or [np.nan]) * 1000
+        print(f"{name:9s} {self.frames / elapsed:6.1f} fps  detect {detect:6.1f} ms  "
+              f"recognize {recognize:6.1f} ms  latency avg {np.nanmean(lat):6.0f} ms  "
+              f"p95 {np.nanpercentile(lat, 95):6.0f} ms")
+
+
+def run_legacy(camera, known_faces, seconds):
+    cascade = cv2.CascadeClassifier(CASCADE)
+    result = Result(camera)
+    r = requests.get(camera.url, stream=True, timeout=5)
+    seq = 0
+    for jpg in legacy_frames(r.iter_content(chunk_size=4096)):
+        seq += 1
+        frame = cv2.imdecode(np.frombuffer(jpg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        with result.timer.stage("detect"):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
+        with result.timer.stage("recognize"):
+            for location in haar_to_locations(faces):
+                recognize_faces(frame, [location], known_faces)
+        result.done(seq)
+        if time.monotonic() - result.start > seconds:
+            break
+    r.close()
+    return result
+
+
+def run_pipelined(camera, known_faces, seconds, tuned):
+    cascade = cv2.CascadeClassifier(CASCADE)
+    result = Result(camera)
+    scheduler = AdaptiveScheduler(HAAR_LEVELS, target_fps=camera.fps)
+    tracker = FaceTracker()
+    motion = MotionGate(every=0)
+    state = {"last_faces": []}
+
+    def process(packet):
+        if not tuned:
+            with result.timer.stage("detect"):
+                gray = cv2.cvtColor(packet.image, cv2.COLOR_BGR2GRAY)
+                faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5,
+                                                 minSize=(30, 30))
+            with result.timer.stage("recognize"):
+                recognize_faces(packet.image, haar_to_locations(faces), known_faces)
+        elif ((motion.update(packet.gray) or state["last_faces"]) and
+                scheduler.should_detect()):
+            with scheduler.timed():
+                with result.timer.stage("detect"):
+                    faces = scheduler.detect_haar(cascade, packet.gray, packet.gray_reduce)
+                with result.timer.stage("recognize"):
+                    state["last_faces"] = recognize_tracked(lambda: packet.image,
+                                                            haar_to_locations(faces),
+                                                            known_faces, tracker)
+        result.done(packet.seq)
+        return packet
+
+    client = MjpegClient(camera.url)
+    pipeline = Pipeline(client.frames, process=process,
+                        gray_reduce=scheduler.gray_reduce if tuned else None).start()
+    time.sleep(seconds)
+    client.close()
+    pipeline.stop()
+    pipeline.join(2)
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the video loop variants end to end")
+    ap.add_argument("--size", type=parse_size, default=(800, 600))
+    ap.add_argument("--fps", type=float, default=20.0, help="Fake camera frame rate")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--seconds", type=float, default=10.0, help="Run time per variant")
+    ap.add_argument("--variants", nargs="+", default=["legacy", "pipeline", "tuned"])
+    args = ap.parse_args()
+
+    known_faces = known_faces_from_images()
+    print(f"{args.size[0]}x{args.size[1]} at {args.fps} fps, {len(known_faces.classnames)} known faces")
+    for name in args.variants:
+        camera = FakeCamera(make_frames(args.size), args.fps, args.jitter).start()
+        try:
+            if name == "legacy":
+                result = run_legacy(camera, known_faces, args.seconds)
+            else:
+                result = run_pipelined(camera, known_faces, args.seconds, tuned=(name == "tuned"))
+        finally:
+            camera.stop()
+        result.report(name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""Several ESP32-CAM streams served by one process.
+
+Each Camera gets its own reader and decoder threads (a Pipeline without a
+processor), so one slow or dead stream never holds up the others.  Decoded
+frames land in a one-frame slot per camera, and a small set of shared
+inference threads take them round-robin: every camera with a new frame is
+served once before any camera is served again, and no camera is processed
+by two threads at once, so per-camera state such as its tracker needs no
+locking.  The known-face index and recognition pool are whatever the
+process function closes over, so all cameras share them.
+"""
+import threading
+import time
+
+import metrics
+import tracing
+from pipeline import Pipeline
+from stream_client import MjpegClient, jpg_url_for
+
+
+def http_mjpeg_client(url, **kwargs):
+    """MjpegClient for the ESP32-CAM's multipart stream at `url`.
+
+    Its `frames` is the Pipeline source; it never ends on its own: it
+    reconnects (`kwargs` go to MjpegClient) and falls back to polling the
+    camera's /jpg endpoint.  Pass the client to CameraRegistry.add() too, so
+    stop() can interrupt a blocked read.
+    """
+    kwargs.setdefault("fallback_url", jpg_url_for(url))
+    return MjpegClient(url, **kwargs)
+
+
+class Camera:
+    """One stream plus whatever per-camera state was passed to CameraRegistry.add()."""
+
+    def __init__(self, name, source, gray_reduce=None, client=None, **state):
+        self.name = name
+        self.source = source
+        self.gray_reduce = gray_reduce
+        self.client = client
+        self.pipeline = None
+        self.__dict__.update(state)
+        self._pending = None
+        self._busy = False
+        self._stale = metrics.stale(name)
+        self._latency = metrics.latency()
+        # Stats
+        self.processed = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.fps = 0.0
+        self._fps_start = time.monotonic()
+        self._fps_frames = 0
+
+    def _record(self, packet):
+        now = time.monotonic()
+        latency = tracing.now() - packet.t_arrival
+        self._latency.observe(latency)
+        self.processed += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self._fps_frames += 1
+        if now - self._fps_start >= 1.0:
+            self.fps = self._fps_frames / (now - self._fps_start)
+            self._fps_start, self._fps_frames = now, 0
+
+    def stats(self):
+        pipeline = self.pipeline.stats() if self.pipeline is not None else {}
+        return {"frames_in": pipeline.get("frames_in", 0), "processed": self.processed,
+                "dropped": self.dropped + sum(pipeline.get("dropped", {}).values()),
+                "fps": self.fps,
+                "latency_avg_ms": (self.latency_total / self.processed * 1000
+                                   if self.processed else None),
+                "latency_max_ms": self.latency_max * 1000}
+
+
+class CameraRegistry:
+    """Run `process(camera, packet)` for the newest frame of every camera, fairly.
+
+    `process` returns the packet (or None to drop it); `render(camera,
+    packet)`, if given, receives what it returns.  `workers` inference threads
+    are shared by all cameras.  Per-camera stats are printed every
+    `report_every` seconds (0 disables).
+    """
+
+    def __init__(self, process, render=None, workers=1, report_every=10.0):
+        self.process = process
+        self.render = render
+        self.workers = workers
+        self.report_every = report_every
+        self.cameras = []
+        self._cond = threading.Condition()
+        self._next = 0
+        self._closed = False
+        self._threads = []
+
+    def add(self, name, source, gray_reduce=None, client=None, **state):
+        """Register a stream; `source` is a Pipeline source, e.g. http_mjpeg_client(url).frames.
+
+        `client`, if given, is closed by stop() to unblock the reader.
+        """
+        camera = Camera(name, source, gray_reduce, client, **state)
+        self.cameras.append(camera)
+        return camera
+
+    def get(self, name):
+        for camera in self.cameras:
+            if camera.name == name:
+                return camera
+        raise KeyError(name)
+
+    def _offer(self, camera, packet):
+        with self._cond:
+            if camera._pending is not None:
+                camera.dropped += 1
+                camera._stale.inc()
+            camera._pending = packet
+            self._cond.notify()
+
+    def _take(self):
+        """Next (camera, packet) in round-robin order, or None once stopped."""
+        def ready():
+            n = len(self.cameras)
+            for i in range(n):
+                camera = self.cameras[(self._next + i) % n]
+                if camera._pending is not None and not camera._busy:
+                    self._next = (self._next + i + 1) % n
+                    return camera
+            return None
+
+        with self._cond:
+            camera = None
+            while not self._closed:
+                camera = ready()
+                if camera is not None:
+                    break
+                self._cond.wait()
+            if camera is None:
+                return None
+            packet, camera._pending = camera._pending, None
+            camera._busy = True
+            return camera, packet
+
+    def _work(self):
+        last_report = time.monotonic()
+        while True:
+            item = self._take()
+            if item is None:
+                return
+            camera, packet = item
+            try:
+                with tracing.TRACER.frame(packet):
+                    result = self.process(camera, packet)
+                if result is not None:
+                    camera._record(result)
+                    if self.render is not None:
+                        self.render(camera, result)
+            except Exception as e:
+                print(f"Camera {camera.name} processing error:", e)
+            finally:
+                with self._cond:
+                    camera._busy = False
+                    self._cond.notify()
+            now = time.monotonic()
+            if (self.report_every and threading.current_thread() is self._threads[0] and
+                    now - last_report >= self.report_every):
+                last_report = now
+                print(f"[cameras] {self.format()}")
+
+    def start(self):
+        for camera in self.cameras:
+            # The pipeline's processor stage only hands frames to the shared workers
+            camera.pipeline = Pipeline(camera.source,
+                                       process=lambda packet, camera=camera: self._offer(camera, packet),
+                                       gray_reduce=camera.gray_reduce, name=camera.name).start()
+        self._threads = [threading.Thread(target=self._work, name=f"inference-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        for camera in self.cameras:
+            if camera.pipeline is not None:
+                camera.pipeline.stop()
+            if camera.client is not None:
+                camera.client.close()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def join(self, timeout=None):
+        """Wait until every stream has ended, then stop the inference threads."""
+        for camera in self.cameras:
+            camera.pipeline.join(timeout)
+        self.stop()
+        for t in self._threads:
+            t.join(timeout)
+
+    def stats(self):
+        return {camera.name: camera.stats() for camera in self.cameras}
+
+    def format(self):
+        parts = []
+        for name, s in self.stats().items():
+            latency = f"{s['latency_avg_ms']:.0f}ms" if s["latency_avg_ms"] is not None else "-"
+            parts.append(f"{name} {s['fps']:.1f}fps latency {latency} "
+                         f"(max {s['latency_max_ms']:.0f}) dropped {s['dropped']}")
+        return "  ".join(parts)
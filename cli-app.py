@@ -1,149 +1,252 @@
+import argparse
 import cv2
-import face_recognition
-import numpy as np
-import os
-import datetime
-import requests
-import serial
-import keyboard  # Library for detecting key presses
+import signal
+import sys
+from face_index import KnownFaceIndex, IVF_MIN_SIZE
+from encoding_cache import load_known_faces
+from cameras import CameraRegistry, http_mjpeg_client
+from recognition import StreamRecognizer
+from worker_pool import RecognitionPool
+from tracker import FaceTracker
+from scheduler import AdaptiveScheduler, HAAR_LEVELS
+from motion import MotionGate
+from command_dispatcher import CommandDispatcher, DEFAULT_DEBOUNCE
+from serial_link import SerialLink, open_fake_robot
+from teleop import run_keyboard_teleop
+from recorder import Recorder
+from event_clips import EventBuffer
+from batch import run_batch
+import metrics
+import tracing
 
 # --- Bluetooth Setup ---
-try:
-    ser = serial.Serial("COM7", 9600, timeout=1)
-    print("Bluetooth serial connection established.")
-except Exception as e:
-    print("Bluetooth Serial Error:", e)
-    ser = None
+# Opened in the background by main() and reopened whenever the Bluetooth
+# connection drops; --port picks another port, --fake-robot a local pty.
+link = SerialLink("COM7", 9600)
 
 # --- Known Face Recognition Setup ---
 known_faces_path = r"C:\Users\arsha\OneDrive\Desktop\new-bot\images"
-known_images = []
-classnames = []
-mylist = os.listdir(known_faces_path)
-print("Known image list:", mylist)
-
-for cl in mylist:
-    img_path = os.path.join(known_faces_path, cl)
-    crimg = cv2.imread(img_path)
-    if crimg is None:
-        continue
-    known_images.append(crimg)
-    classnames.append(os.path.splitext(cl)[0])
-
+classnames, encodings = load_known_faces(known_faces_path)
+# Exact search unless --ivf-nprobe opts into the approximate IVF index
+known_faces = KnownFaceIndex(classnames, encodings)
 print("Known class names:", classnames)
 
-def find_encodings(images):
-    encodelist = []
-    for img in images:
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        try:
-            encode = face_recognition.face_encodings(img_rgb)[0]
-        except IndexError:
-            continue  # Skip images with no detectable face
-        encodelist.append(encode)
-    return encodelist
-
-encodelist_known = find_encodings(known_images)
-print("Encoding complete...")
-
 # Initialize Haar Cascade for face detection
 face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
 
+# Every camera tracks faces between detections so identities are re-embedded
+# only every REEMBED_EVERY detections instead of on every one, and adapts its
+# detection resolution, frame skipping and cascade parameters to keep up
+# with TARGET_FPS.  See add_camera().  A known face whose Open is not
+# cooling down is always re-embedded first, in case someone else stepped
+# into its box.
+REEMBED_EVERY = 15
+TARGET_FPS = 15
+
 # Set SIMULATION_MODE to False to use Bluetooth communication.
 SIMULATION_MODE = False
 
-def send_command(command):
-    # Send the command via Bluetooth if available.
-    if ser is not None:
-        try:
-            ser.write((command + "\n").encode('utf-8'))
-        except Exception as e:
-            print("Error sending command:", e)
+def write_command(command):
+    # Runs on the dispatcher's writer thread; the link batches and sends it
+    link.write(command + "\n")
     print(f"Sent command: {command}")
 
-# Use your ESP32-CAM stream URL.
+# Seconds between two "Open" commands for the same recognized person.
+OPEN_COOLDOWN = 5.0
+# Commands go through one writer thread that drops duplicates and keeps
+# "Stop" ahead of everything else, so the 9600-baud link never backs up.
+# Created by main() once the recognition workers have been forked: forking
+# a process with running threads can leave locks held in the children.
+dispatcher = None
+
+def send_command(command, key=None):
+    return dispatcher.send(command, key)
+
+def would_open(name):
+    return not dispatcher.cooling_down("Open", name)
+
+# Use your ESP32-CAM stream URL; add more cameras with --camera NAME=URL.
 stream_url = "http://192.168.1.8/mjpeg/1"  # Adjust if necessary
 
-def process_video_stream():
-    r = requests.get(stream_url, stream=True)
-    bytes_data = bytes()
-    for chunk in r.iter_content(chunk_size=1024):
-        bytes_data += chunk
-        a = bytes_data.find(b'\xff\xd8')
-        b = bytes_data.find(b'\xff\xd9')
-        if a != -1 and b != -1:
-            jpg = bytes_data[a:b+2]
-            bytes_data = bytes_data[b+2:]
-            data = np.frombuffer(jpg, dtype=np.uint8)
-            if data.size == 0:
-                continue
-            frame = cv2.imdecode(data, cv2.IMREAD_COLOR)
-            if frame is None:
-                continue
-
-            # --- Face Detection & Recognition ---
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30))
-            recognized = False  # Flag to check if at least one face is recognized
-            for (x, y, w, h) in faces:
-                # Convert Haar detection coordinates to face_recognition format: (top, right, bottom, left)
-                top, right, bottom, left = y, x+w, y+h, x
-                face_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_encodings = face_recognition.face_encodings(face_rgb, [(top, right, bottom, left)])
-                name = "Unknown"
-                if face_encodings:
-                    encoding = face_encodings[0]
-                    matches = face_recognition.compare_faces(encodelist_known, encoding)
-                    face_distances = face_recognition.face_distance(encodelist_known, encoding)
-                    if len(face_distances) > 0:
-                        best_match_index = np.argmin(face_distances)
-                        if matches[best_match_index]:
-                            name = classnames[best_match_index].upper()
-                            recognized = True  # A recognized face is found
-                print(f"Detected face: {name} at ({x}, {y})")
-            # If a recognized face is found, send the "Open" command via Bluetooth
-            if recognized:
-                send_command("Open")
-            # --- End Face Detection & Recognition ---
+def add_camera(registry, name, url, pool=None, record=None, events_dir=None):
+    scheduler = AdaptiveScheduler(HAAR_LEVELS, target_fps=TARGET_FPS)
+    # The decoder only produces the grayscale frame detection needs, already
+    # reduced towards the camera's detection scale.
+    # With `record` (Recorder arguments) the raw JPEGs are also written to
+    # disk as they arrive, without decoding or re-encoding them.
+    client = http_mjpeg_client(url)
+    source = client.frames
+    recorder = None
+    if record is not None:
+        recorder = Recorder(prefix=name, **record)
+        source = recorder.tee(source)
+    # With `events_dir` the last seconds stay in memory and a recognized or
+    # unknown face saves them, plus the seconds after, as a clip.
+    events = None
+    if events_dir is not None:
+        events = EventBuffer(events_dir, prefix=name)
+        source = events.tee(source)
+    # All cameras share the worker pool; results are keyed by camera name.
+    # Every camera that sees a person keeps its own clip.
+    recognizer = StreamRecognizer(face_cascade, known_faces, scheduler,
+                                  FaceTracker(reembed_every=REEMBED_EVERY), MotionGate(),
+                                  send_command, would_open=would_open, events=events,
+                                  pool=pool, stream=name)
+    return registry.add(name, source, gray_reduce=scheduler.gray_reduce, client=client,
+                        recognizer=recognizer, recorder=recorder, events=events, names=[])
+
+def process_frame(camera, packet):
+    # Sends "Open" for every recognized face, at most once per OPEN_COOLDOWN
+    # seconds for each person; see --trace for the arrival-to-Open latency
+    packet = camera.recognizer.process(packet)
+    if packet is not None:
+        # Logged only when who is in view changes; per-frame numbers are in
+        # the metrics and the trace
+        names = sorted(face[4] for face in packet.faces)
+        if names != camera.names:
+            camera.names = names
+            for (top, right, bottom, left, name) in packet.faces:
+                print(f"[{camera.name}] Detected face: {name} at ({left}, {top})")
+    return packet
+
+def process_video_streams(cameras, pool=None, record=None, events_dir=None):
+    # Every camera is read and decoded on its own threads so recognition always
+    # works on the newest frames instead of a growing backlog; the recognition
+    # thread serves the cameras round-robin.  Only a reduced grayscale frame
+    # is decoded up front; the colour frame is decoded when a face has to be
+    # encoded.
+    registry = CameraRegistry(process_frame)
+    for name, url in cameras:
+        add_camera(registry, name, url, pool, record, events_dir)
+    registry.start()
+    try:
+        registry.join()
+    except KeyboardInterrupt:
+        # Wait for the recognition threads too: the worker pool is closed
+        # next and must not get any more frames
+        registry.stop()
+        registry.join(2.0)
+    print(f"[cameras] {registry.format()}")
+    for camera in registry.cameras:
+        if camera.recorder is not None:
+            camera.recorder.close()
+            print(f"[{camera.name}] Recording:", camera.recorder.stats())
+        if camera.events is not None:
+            camera.events.close()
+            print(f"[{camera.name}] Event clips:", camera.events.stats())
 
 # --- Keyboard Teleoperation ---
-def teleop():
+def teleop(heartbeat):
     print("Starting teleoperation. Use Arrow Keys to control the robot.")
     print("Press 'Q' to quit.")
-
-    # Map keys to commands
-    key_command_map = {
-        "up": "Forward",
-        "down": "Backward",
-        "left": "Left",
-        "right": "Right",
-    }
-
-    while True:
-        # Check for key presses
-        for key, command in key_command_map.items():
-            if keyboard.is_pressed(key):
-                send_command(command)
-                break  # Send only one command at a time
-        else:
-            # If no movement key is pressed, send "Stop"
-            send_command("Stop")
-
-        # Exit on 'Q' key press
-        if keyboard.is_pressed("q"):
-            print("Exiting teleoperation.")
-            break
+    # Commands are only sent when the pressed arrows change, plus a keepalive
+    # every `heartbeat` seconds while one is held.
+    stats = run_keyboard_teleop(send_command, heartbeat=heartbeat)
+    print("Exiting teleoperation.")
+    print(f"Teleop: {stats['changes']} changes, {stats['keepalives']} keepalives, "
+          f"{stats['commands_per_s']:.2f} commands/s, {stats['cpu_s']:.2f} s CPU")
 
 def main():
     parser = argparse.ArgumentParser(description="SCOUTX - Surveillance Robot Control")
     parser.add_argument("--teleop", action="store_true", help="Start keyboard teleoperation")
+    parser.add_argument("--heartbeat", type=float, default=0.5,
+                        help="Seconds between keepalive repeats of a held teleop command "
+                             "(at least %g: quicker repeats are debounced)" % DEFAULT_DEBOUNCE)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes for face embeddings (0 = run on the video thread; "
+                             "with --input, 0 = one per core)")
+    parser.add_argument("--camera", action="append", default=[], metavar="NAME=URL",
+                        help="MJPEG stream to watch; repeat for several cameras")
+    parser.add_argument("--port", default=link.port, help="Serial port of the robot's Bluetooth link")
+    parser.add_argument("--ack", default=None,
+                        help="Reply line prefix the robot acknowledges commands with, to measure latency")
+    parser.add_argument("--fake-robot", action="store_true",
+                        help="Talk to a simulated robot on a pseudo-terminal instead (POSIX only)")
+    parser.add_argument("--metrics-port", type=int, default=9108,
+                        help="Serve Prometheus metrics on 127.0.0.1:PORT/metrics (0 = off)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Write a Chrome/Perfetto trace of the last frames here on exit "
+                             "(SIGUSR1 dumps one at any time)")
+    parser.add_argument("--record", metavar="DIR",
+                        help="Record every camera's raw MJPEG stream into DIR (see recorder.py)")
+    parser.add_argument("--record-segment", type=float, default=300.0,
+                        help="Seconds per recording segment")
+    parser.add_argument("--record-max-gb", type=float, default=None,
+                        help="Delete the oldest segments once all cameras' recordings exceed this many GiB")
+    parser.add_argument("--record-max-days", type=float, default=None,
+                        help="Delete segments older than this many days")
+    parser.add_argument("--events", metavar="DIR",
+                        help="Save clips around recognized and unknown faces into DIR")
+    parser.add_argument("--ivf-nprobe", type=int, default=None, metavar="N",
+                        help="Search galleries of %d+ identities with the approximate IVF index, "
+                             "probing N clusters per face; it can miss known faces (recall "
+                             "is documented in face_index.py)" % IVF_MIN_SIZE)
+    parser.add_argument("--input", nargs="+", metavar="PATH",
+                        help="Process video files, .mjpeg captures or image directories offline "
+                             "instead of the live stream")
+    parser.add_argument("--output", default="-",
+                        help="JSON Lines results of --input (default: stdout)")
     args = parser.parse_args()
+    global dispatcher, known_faces
+    if args.heartbeat < DEFAULT_DEBOUNCE:
+        parser.error(f"--heartbeat must be at least {DEFAULT_DEBOUNCE} s, the command debounce: "
+                     "quicker keepalives would never reach the robot")
+
+    if args.ivf_nprobe:
+        known_faces = KnownFaceIndex(classnames, encodings, backend="auto", nprobe=args.ivf_nprobe)
+
+    if args.input:
+        # Offline: no robot link, every core on recognition
+        output = sys.stdout if args.output == "-" else open(args.output, "w")
+        try:
+            stats = run_batch(args.input, known_faces, output, workers=args.workers or None)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print(f"Processed {stats['frames']} frames ({stats['faces']} faces) in "
+              f"{stats['seconds']:.1f} s: {stats['fps']:.1f} frames/s", file=sys.stderr)
+        return
+
+    # Fork the recognition workers before any thread of this process starts
+    pool = None
+    if not args.teleop and args.workers > 0:
+        pool = RecognitionPool(workers=args.workers)
+    dispatcher = CommandDispatcher(write_command, cooldowns={"Open": OPEN_COOLDOWN})
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port)
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: tracing.dump())
+
+    link.port = args.port
+    link.ack = args.ack.encode() if args.ack else None
+    if args.fake_robot:
+        link.port, _ = open_fake_robot(ack=args.ack or "OK")
+        link.ack = link.ack or b"OK"
+    link.start()
 
     if args.teleop:
-        teleop()
+        teleop(args.heartbeat)
     else:
+        cameras = [tuple(c.split("=", 1)) if "=" in c else (f"cam{i}", c)
+                   for i, c in enumerate(args.camera)] or [("cam0", stream_url)]
+        record = None
+        if args.record:
+            record = {"directory": args.record, "segment_seconds": args.record_segment,
+                      "max_bytes": args.record_max_gb and int(args.record_max_gb * 2**30),
+                      "max_age": args.record_max_days and args.record_max_days * 86400}
         print("Starting video stream processing...")
-        process_video_stream()
+        try:
+            process_video_streams(cameras, pool, record, args.events)
+        finally:
+            if pool is not None:
+                pool.close()
+    dispatcher.close()
+    print("Command link:", dispatcher.stats())
+    link.close()
+    print("Serial link:", link.stats())
+    if args.trace:
+        tracing.dump(args.trace)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
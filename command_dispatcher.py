@@ -0,0 +1,165 @@
+"""Debounced, rate-limited command queue for the robot's serial link.
+
+The HC-05 link runs at 9600 baud, about 1 ms per byte.  Writing "Open" on
+every recognized frame or "Stop" on every teleop poll fills its buffer and
+delays the commands that matter.  CommandDispatcher puts a queue and one
+writer thread in front of the link:
+
+* a command that is already waiting is not queued twice, and a newer
+  command of the same group replaces a waiting one ("Left" supersedes a
+  queued "Forward": only the latest drive command matters);
+* repeating the command last written for a group within `debounce`
+  seconds is dropped;
+* `cooldowns` limit a command per key instead, e.g. "Open" once per 5 s
+  for each recognized identity (such commands are not debounced, so two
+  people recognized back to back both get theirs);
+* priority commands ("Stop") jump the queue;
+* writes are spaced at least `min_interval` apart.
+"""
+import collections
+import threading
+import time
+
+# Drive commands share one group so the newest one wins
+DRIVE = "drive"
+DEFAULT_GROUPS = {"Forward": DRIVE, "Backward": DRIVE, "Left": DRIVE, "Right": DRIVE,
+                  "Stop": DRIVE}
+# Repeats closer together than this are dropped, keepalives included
+DEFAULT_DEBOUNCE = 0.25
+
+
+class CommandDispatcher:
+    def __init__(self, write, cooldowns=None, priority=("Stop",), groups=None,
+                 debounce=DEFAULT_DEBOUNCE, min_interval=0.02):
+        self.write = write
+        self.cooldowns = dict(cooldowns or {})
+        self.priority = set(priority)
+        self.groups = DEFAULT_GROUPS if groups is None else groups
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self._cond = threading.Condition()
+        self._pending = collections.deque()  # (command, t_queued)
+        self._last_sent = {}  # group -> (command, t_sent)
+        self._last_key = {}  # (command, key) -> t_accepted
+        self._closed = False
+        # Stats
+        self.sent = 0
+        self.coalesced = 0
+        self.suppressed = 0
+        self.max_wait = 0.0
+        self._thread = threading.Thread(target=self._run, name="command-writer", daemon=True)
+        self._thread.start()
+
+    def _group(self, command):
+        return self.groups.get(command, command)
+
+    def send(self, command, key=None):
+        """Queue `command`; returns False if it was dropped as redundant.
+
+        `key` scopes the command's cooldown (e.g. the recognized name for
+        "Open").  A command with a cooldown that is already waiting for
+        another key is not queued again, but counts as sent for this key.
+        Never blocks on the serial link.
+        """
+        now = time.monotonic()
+        group = self._group(command)
+        with self._cond:
+            cooldown = self.cooldowns.get(command)
+            if cooldown is not None:
+                last = self._last_key.get((command, key))
+                if last is not None and now - last < cooldown:
+                    self.suppressed += 1
+                    return False
+            if any(c == command for c, _ in self._pending):
+                self.coalesced += 1
+                if cooldown is None:
+                    return False
+                # The waiting command is written for this key too (one "Open"
+                # lets in both people): start its cooldown and report it sent
+                self._last_key[(command, key)] = now
+                return True
+            last = self._last_sent.get(group)
+            if (cooldown is None and last is not None and last[0] == command and
+                    now - last[1] < self.debounce and
+                    not any(self._group(c) == group for c, _ in self._pending)):
+                self.suppressed += 1
+                return False
+            if cooldown is not None:
+                self._last_key[(command, key)] = now
+            # A newer command of the same group replaces the one still waiting
+            for item in [i for i in self._pending if self._group(i[0]) == group]:
+                self._pending.remove(item)
+                self.coalesced += 1
+            if command in self.priority:
+                self._pending.appendleft((command, now))
+            else:
+                self._pending.append((command, now))
+            self._cond.notify()
+        return True
+
+    def cooling_down(self, command, key=None):
+        """True while send(command, key) would be dropped by the command's cooldown."""
+        cooldown = self.cooldowns.get(command)
+        if cooldown is None:
+            return False
+        with self._cond:
+            last = self._last_key.get((command, key))
+        return last is not None and time.monotonic() - last < cooldown
+
+    def _run(self):
+        next_write = 0.0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                delay = next_write - time.monotonic()
+                if delay > 0:
+                    # Rate limit; a priority command may still jump ahead meanwhile
+                    self._cond.wait(delay)
+                    continue
+                command, t_queued = self._pending.popleft()
+                now = time.monotonic()
+                self._last_sent[self._group(command)] = (command, now)
+            self.max_wait = max(self.max_wait, now - t_queued)
+            try:
+                self.write(command)
+            except Exception as e:
+                print("Error sending command:", e)
+            self.sent += 1
+            next_write = time.monotonic() + self.min_interval
+
+    def stats(self):
+        return {"sent": self.sent, "coalesced": self.coalesced, "suppressed": self.suppressed,
+                "max_wait_ms": self.max_wait * 1000}
+
+    def close(self, timeout=1.0):
+        """Flush what is queued (within `timeout`) and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+
+def check():
+    """Self-check of the coalescing rules against a fake link; raises AssertionError."""
+    written = []
+    dispatcher = CommandDispatcher(written.append, cooldowns={"Open": 5.0})
+    # Two people back to back: each gets an Open, whether or not the first
+    # one has been written yet
+    assert dispatcher.send("Open", "A")
+    assert dispatcher.send("Open", "B")
+    time.sleep(0.1)
+    assert dispatcher.send("Open", "C")
+    assert not dispatcher.send("Open", "A"), "A is cooling down"
+    assert dispatcher.cooling_down("Open", "A") and not dispatcher.cooling_down("Open", "D")
+    dispatcher.send("Forward")
+    time.sleep(0.1)
+    assert not dispatcher.send("Forward"), "debounced"
+    dispatcher.close()
+    assert written == ["Open", "Open", "Forward"], written
+    print("CommandDispatcher:", dispatcher.stats())
+
+
+if __name__ == "__main__":
+    check()
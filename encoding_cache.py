@@ -0,0 +1,123 @@
+"""Persistent cache of known-face encodings.
+
+The encodings of every image in the known-faces directory are kept in
+`.encodings.npy` (one 128-d row per image) next to `.encodings.json`, an
+index of file name, size, mtime, content hash and row.  On startup only
+images that are new or whose content changed are run through
+face_recognition again; everything else comes from a single np.load().
+"""
+import hashlib
+import json
+import os
+
+import cv2
+import face_recognition
+import numpy as np
+
+CACHE_VERSION = 1
+MATRIX_FILE = ".encodings.npy"
+INDEX_FILE = ".encodings.json"
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def encode_image(path):
+    """Return the 128-d encoding of the first face in `path`, or None."""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    encodings = face_recognition.face_encodings(img_rgb)
+    if not encodings:
+        return None
+    return encodings[0]
+
+
+def _load_cache(images_path):
+    try:
+        with open(os.path.join(images_path, INDEX_FILE)) as f:
+            index = json.load(f)
+        if index.get("version") != CACHE_VERSION:
+            return {}, None
+        matrix = np.load(os.path.join(images_path, MATRIX_FILE))
+    except (OSError, ValueError):
+        return {}, None
+    return index.get("files", {}), matrix
+
+
+def _save_cache(images_path, files, matrix):
+    # Write to temporary files first so a crash never leaves a torn cache.
+    matrix_path = os.path.join(images_path, MATRIX_FILE)
+    index_path = os.path.join(images_path, INDEX_FILE)
+    with open(matrix_path + ".tmp", "wb") as f:
+        np.save(f, matrix)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f)
+    os.replace(matrix_path + ".tmp", matrix_path)
+    os.replace(index_path + ".tmp", index_path)
+
+
+def load_known_faces(images_path):
+    """Return (classnames, encodings) for the images in `images_path`.
+
+    `encodings` is an (N, 128) float64 array whose rows line up with
+    `classnames`; images without a detectable face are left out of both.
+    """
+    cached, cached_matrix = _load_cache(images_path)
+    by_hash = {entry["sha1"]: entry for entry in cached.values()}
+
+    files = {}
+    rows = []
+    classnames = []
+    reencoded = 0
+    for cl in sorted(os.listdir(images_path)):
+        path = os.path.join(images_path, cl)
+        if cl.startswith(".") or not os.path.isfile(path):
+            continue
+        st = os.stat(path)
+        entry = cached.get(cl)
+        if entry is None or entry["size"] != st.st_size or entry["mtime"] != st.st_mtime:
+            # Changed or new: the content hash still catches touched or renamed files.
+            digest = file_hash(path)
+            entry = by_hash.get(digest)
+            if entry is not None and entry.get("row", -1) >= 0:
+                encoding = cached_matrix[entry["row"]]
+            elif entry is not None:
+                encoding = None
+            else:
+                encoding = encode_image(path)
+                reencoded += 1
+            entry = {"size": st.st_size, "mtime": st.st_mtime, "sha1": digest}
+        else:
+            encoding = cached_matrix[entry["row"]] if entry.get("row", -1) >= 0 else None
+
+        if encoding is None:
+            files[cl] = dict(entry, row=-1)  # Remember images with no detectable face
+            continue
+        files[cl] = dict(entry, row=len(rows))
+        rows.append(np.asarray(encoding, dtype=np.float64))
+        classnames.append(os.path.splitext(cl)[0])
+
+    matrix = np.array(rows, dtype=np.float64).reshape(len(rows), 128)
+    if files != cached:
+        _save_cache(images_path, files, matrix)
+    print(f"Loaded {len(classnames)} known encodings ({reencoded} re-encoded).")
+    return classnames, matrix
+
+
+def add_known_face(images_path, filename, encoding):
+    """Record a freshly captured face so the next startup does not re-encode it."""
+    cached, cached_matrix = _load_cache(images_path)
+    path = os.path.join(images_path, filename)
+    st = os.stat(path)
+    rows = np.zeros((0, 128)) if cached_matrix is None else cached_matrix
+    rows = np.vstack([rows, np.asarray(encoding, dtype=np.float64)[None, :]])
+    cached[filename] = {"size": st.st_size, "mtime": st.st_mtime, "sha1": file_hash(path),
+                        "row": len(rows) - 1}
+    _save_cache(images_path, cached, rows)
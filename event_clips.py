@@ -0,0 +1,231 @@
+"""Save the seconds around a recognition event as a clip.
+
+    events = EventBuffer("events", pre_seconds=5, post_seconds=5)
+    pipeline = Pipeline(events.tee(stream_client.frames), ...)
+    ...
+    events.trigger("open", name)        # from the recognition loop
+
+EventBuffer keeps the last `pre_seconds` of raw JPEG frames in memory,
+bounded by `max_bytes`, so nothing is decoded or re-encoded.  trigger()
+only takes a reference to what is buffered and marks the event open; the
+frames of the next `post_seconds` are added as they arrive.  Once the
+window has passed (noticed by the next frame, or by a timer when the
+stream has stalled), a writer thread saves the clip as
+<time>-<kind>-<label>.mjpeg (replayable with fake_esp32.py) plus a .json
+with the event details, so evidence capture never waits on the disk.  A
+trigger for an event that is still open, e.g. the same unknown face on the
+next frame, extends it instead of starting another clip, up to
+`max_clip_seconds`; once it is closed, the same kind and label start a new
+clip at most every `cooldown` seconds, so a person who stays in view does
+not fill the disk.  The frames the open events hold, pre-roll included,
+are bounded by `max_bytes` too, across all of them: a new event drops its
+oldest pre-roll frames to fit, and once the budget is reached the event
+that would grow past it is saved as it is.
+"""
+import collections
+import datetime
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from recorder import write_clip
+
+
+class _Event:
+    def __init__(self, kind, label, timestamp, frames, pre_bytes, end):
+        self.kind = kind
+        self.label = label
+        self.timestamp = timestamp
+        self.frames = frames  # [(timestamp, jpeg)]
+        self.end = end
+        self.pre_bytes = pre_bytes  # Frames taken from the ring at the trigger
+        self.post_bytes = 0  # Frames added after the trigger
+        self.triggers = 1
+
+
+class EventBuffer:
+    def __init__(self, directory, pre_seconds=5.0, post_seconds=5.0, max_bytes=32 * 2**20,
+                 max_clip_seconds=60.0, prefix="cam", max_pending=8, cooldown=30.0):
+        self.directory = directory
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.max_bytes = max_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.prefix = prefix
+        self.max_pending = max_pending
+        self.cooldown = cooldown
+        os.makedirs(directory, exist_ok=True)
+        self._ring = collections.deque()  # (timestamp, jpeg), oldest first
+        self._ring_bytes = 0
+        self._open = {}  # (kind, label) -> _Event still collecting frames
+        self._open_bytes = 0  # Sum of their pre_bytes and post_bytes
+        self._started = {}  # (kind, label) -> timestamp of its last clip
+        self._lock = threading.Lock()
+        self._done = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._rearm = False  # A new event may end before the writer's timer
+        # Stats
+        self.events = 0
+        self.extended = 0
+        self.suppressed = 0
+        self.saved = 0
+        self.skipped = 0
+        self.truncated = 0
+        self.timed_out = 0
+        self._thread = threading.Thread(target=self._run, name=f"event-clips-{prefix}", daemon=True)
+        self._thread.start()
+
+    def write(self, jpeg, timestamp=None):
+        """Add one frame; `jpeg` must not be modified afterwards."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self._ring.append((timestamp, jpeg))
+            self._ring_bytes += len(jpeg)
+            while self._ring and (timestamp - self._ring[0][0] > self.pre_seconds or
+                                  self._ring_bytes > self.max_bytes):
+                self._ring_bytes -= len(self._ring.popleft()[1])
+            finished = []
+            for key, event in list(self._open.items()):
+                if timestamp <= event.end and self._open_bytes + len(jpeg) > self.max_bytes:
+                    self.truncated += 1
+                elif timestamp <= event.end:
+                    event.frames.append((timestamp, jpeg))
+                    event.post_bytes += len(jpeg)
+                    self._open_bytes += len(jpeg)
+                    continue
+                finished.append(self._open.pop(key))
+                self._open_bytes -= event.pre_bytes + event.post_bytes
+        for event in finished:
+            self._finish(event)
+
+    def tee(self, source):
+        """Wrap a Pipeline source so every JPEG it yields is also buffered."""
+        def frames():
+            for frame in source():
+                if not isinstance(frame, np.ndarray):  # Decoded images are not buffered
+                    self.write(frame)
+                yield frame
+        return frames
+
+    def trigger(self, kind, label=None, timestamp=None):
+        """Start (or extend) an event; returns True if this started a new clip.
+
+        Meant to be called for every frame that shows the event: repeats
+        extend the open clip or fall within `cooldown`.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        key = (kind, label)
+        with self._lock:
+            event = self._open.get(key)
+            if event is not None:
+                event.end = min(timestamp + self.post_seconds,
+                                event.timestamp + self.max_clip_seconds)
+                event.triggers += 1
+                self.extended += 1
+                return False
+            last = self._started.get(key)
+            if last is not None and timestamp - last < self.cooldown:
+                self.suppressed += 1
+                return False
+            self._started[key] = timestamp
+            # The pre-roll is shared with the ring but outlives it: count it
+            # against max_bytes and drop its oldest frames to fit
+            frames = list(self._ring)
+            pre_bytes = self._ring_bytes
+            first = 0
+            while first < len(frames) and self._open_bytes + pre_bytes > self.max_bytes:
+                pre_bytes -= len(frames[first][1])
+                first += 1
+            if first:
+                self.truncated += 1
+            self._open_bytes += pre_bytes
+            self._open[key] = _Event(kind, label, timestamp, frames[first:], pre_bytes,
+                                     timestamp + self.post_seconds)
+            self.events += 1
+        with self._cond:
+            self._rearm = True
+            self._cond.notify()
+        return True
+
+    def _finish(self, event):
+        with self._cond:
+            if len(self._done) >= self.max_pending:
+                self.skipped += 1  # Disk far behind: keep memory bounded instead
+                return
+            self._done.append(event)
+            self._cond.notify()
+
+    def _expire(self):
+        """Finish the events whose window passed without a frame to close it.
+
+        Returns the seconds until the next open event ends, or None.
+        """
+        now = time.time()
+        with self._lock:
+            finished = [self._open.pop(key) for key, event in list(self._open.items())
+                        if event.end < now]
+            for event in finished:
+                self._open_bytes -= event.pre_bytes + event.post_bytes
+            ends = [event.end for event in self._open.values()]
+        for event in finished:
+            self.timed_out += 1
+            self._finish(event)
+        return min(ends) - now if ends else None
+
+    def _run(self):
+        while True:
+            timeout = self._expire()
+            with self._cond:
+                if not (self._done or self._closed or self._rearm):
+                    self._cond.wait(timeout)
+                self._rearm = False
+                if not self._done:
+                    if self._closed:
+                        return
+                    continue
+                event = self._done.popleft()
+            try:
+                self._save(event)
+            except OSError as e:
+                print(f"Event clip {event.kind}: {e}")
+
+    def _save(self, event):
+        stamp = datetime.datetime.fromtimestamp(event.timestamp).strftime("%Y%m%d-%H%M%S")
+        name = "-".join([self.prefix, stamp, event.kind] +
+                        ([re.sub(r"[^\w.-]", "_", str(event.label))] if event.label else []))
+        base = os.path.join(self.directory, name)
+        count = write_clip(base + ".mjpeg", (jpeg for _, jpeg in event.frames))
+        info = {"kind": event.kind, "label": event.label, "camera": self.prefix,
+                "time": datetime.datetime.fromtimestamp(event.timestamp).isoformat(),
+                "triggers": event.triggers, "frames": count,
+                "start": event.frames[0][0] - event.timestamp if event.frames else None,
+                "end": event.frames[-1][0] - event.timestamp if event.frames else None}
+        with open(base + ".json", "w") as f:
+            json.dump(info, f, indent=2)
+        self.saved += 1
+        print(f"[events] saved {name}.mjpeg ({count} frames)")
+
+    def close(self, timeout=5.0):
+        """Save the open events with what they have so far, then stop."""
+        with self._lock:
+            events, self._open = list(self._open.values()), {}
+            self._open_bytes = 0
+        for event in events:
+            self._finish(event)
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"events": self.events, "extended": self.extended,
+                "suppressed": self.suppressed, "saved": self.saved,
+                "skipped": self.skipped, "truncated": self.truncated,
+                "timed_out": self.timed_out,
+                "buffered_frames": len(self._ring),
+                "buffered_bytes": self._ring_bytes, "open_bytes": self._open_bytes}
@@ -0,0 +1,125 @@
+"""Vectorised matching of face encodings against the known faces.
+
+face_recognition.compare_faces() and face_distance() each rebuild an array
+from the known-encoding list and compute the same norms; calling both for
+every face in every frame does that work 2 x faces times.  KnownFaceIndex
+keeps the known encodings in one contiguous float32 matrix with their
+squared norms precomputed, so all faces of a frame are matched with a
+single matrix product.
+
+For large galleries the exact scan can be swapped for the IVF search in
+ann_index.py with backend="ivf", or backend="auto" to switch over once the
+gallery reaches IVF_MIN_SIZE identities.  IVF is approximate: a known face
+whose nearest cell is not probed comes back as another name or as None, so
+it is opt-in and exact search stays the default.
+"""
+import threading
+
+import numpy as np
+
+from ann_index import IVFIndex
+
+# Same default as face_recognition.compare_faces()
+DEFAULT_TOLERANCE = 0.6
+# Below this many identities the exact matrix product is already faster.
+# Recall of IVF against exact search (bench_face_index.py, synthetic
+# encodings): 2000 identities 91% at nprobe 1, 99.4% at 4, 100% at 8;
+# 100000 identities 60% at nprobe 1, 92% at 4, 98% at 8, 99.6% at 16.
+IVF_MIN_SIZE = 2000
+BACKENDS = ("exact", "ivf", "auto")
+
+
+class KnownFaceIndex:
+    """Known encodings plus their names, matched with match().
+
+    `nprobe` only applies to the IVF backend: the number of clusters
+    searched per face.  Higher is slower but finds the true nearest
+    neighbour more often (see IVF_MIN_SIZE for measured recall).
+    """
+
+    def __init__(self, classnames=(), encodings=None, tolerance=DEFAULT_TOLERANCE,
+                 backend="exact", nprobe=8, nlist=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        self.tolerance = tolerance
+        self.backend = backend
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self._lock = threading.Lock()
+        if encodings is None or len(encodings) == 0:
+            encodings = np.zeros((0, 128), dtype=np.float32)
+        matrix = np.ascontiguousarray(encodings, dtype=np.float32)
+        self._set(list(classnames), matrix, self._build_ann(matrix))
+
+    def _use_ann(self, n):
+        return n > 0 and (self.backend == "ivf" or (self.backend == "auto" and n >= IVF_MIN_SIZE))
+
+    def _build_ann(self, matrix):
+        if not self._use_ann(len(matrix)):
+            return None
+        return IVFIndex(matrix, nlist=self.nlist, nprobe=self.nprobe)
+
+    def _set(self, classnames, matrix, ann):
+        if len(classnames) != len(matrix):
+            raise ValueError(f"{len(classnames)} names for {len(matrix)} encodings")
+        # Readers grab this tuple once per call, so add() can swap in a new
+        # matrix while the video thread is matching.
+        self._data = (classnames, matrix, np.einsum("ij,ij->i", matrix, matrix), ann)
+
+    @property
+    def classnames(self):
+        return self._data[0]
+
+    @property
+    def encodings(self):
+        return self._data[1]
+
+    @property
+    def ann(self):
+        """The IVFIndex in use, or None for exact search."""
+        return self._data[3]
+
+    def __len__(self):
+        return len(self._data[0])
+
+    def add(self, name, encoding):
+        with self._lock:
+            classnames, matrix, _, ann = self._data
+            row = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+            matrix = np.concatenate([matrix, row])
+            if ann is None or len(matrix) > 2 * ann.trained_size:
+                # Re-cluster once the gallery has doubled since the last training
+                ann = self._build_ann(matrix)
+            else:
+                ann = ann.with_added(len(matrix) - 1, row)
+            self._set(classnames + [name], matrix, ann)
+
+    def nearest(self, encodings):
+        """Return (indices, distances) of the closest known face for each row."""
+        return self._nearest(self._data, encodings)
+
+    def _nearest(self, data, encodings):
+        _, matrix, sq_norms, ann = data
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        if len(matrix) == 0 or len(queries) == 0:
+            return np.full(len(queries), -1), np.full(len(queries), np.inf, dtype=np.float32)
+        if ann is not None:
+            return ann.search(queries, self.nprobe)
+        # |q - k|^2 = |q|^2 + |k|^2 - 2 q.k, for every (query, known) pair at once
+        d2 = sq_norms[None, :] - 2.0 * (queries @ matrix.T)
+        best = np.argmin(d2, axis=1)
+        best_d2 = d2[np.arange(len(queries)), best] + np.einsum("ij,ij->i", queries, queries)
+        return best, np.sqrt(np.maximum(best_d2, 0.0))
+
+    def match(self, encodings):
+        """Return (names, distances) for a batch of face encodings.
+
+        names[i] is the closest known name, or None when its distance is
+        above the tolerance.
+        """
+        data = self._data
+        classnames = data[0]
+        indices, distances = self._nearest(data, encodings)
+        names = [classnames[i] if i >= 0 and d <= self.tolerance else None
+                 for i, d in zip(indices.tolist(), distances.tolist())]
+        return names, distances
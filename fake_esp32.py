@@ -0,0 +1,231 @@
+"""Local stand-in for the ESP32-CAM firmware, for tests and benchmarks.
+
+    python fake_esp32.py images/ --fps 15 --size 800x600 --jitter 0.01
+    python app5.py   # with stream_url = "http://127.0.0.1:8080/mjpeg/1"
+
+Serves /mjpeg/1 and /jpg with the same bytes esp32_camera_mjpeg.ino
+writes: its HTTP header, the 123456789000000000000987654321 boundary, a
+Content-Type/Content-Length part header per frame, and each piece in a
+separate write like the firmware's client.write() calls.  Frames come from
+JPEG files, directories of them, or .mjpeg captures (e.g. recorded with
+curl from the real camera) and are replayed in a loop at `fps`, optionally
+re-encoded to another resolution and with random timing jitter.
+
+FakeCamera records when every frame was sent on every connection, so a
+benchmark in the same process can compute glass-to-result latency.
+"""
+import argparse
+import glob
+import os
+import random
+import socketserver
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from mjpeg_parser import BOUNDARY, MjpegParser
+
+HEADER = (b"HTTP/1.1 200 OK\r\n"
+          b"Access-Control-Allow-Origin: *\r\n"
+          b"Content-Type: multipart/x-mixed-replace; boundary=" + BOUNDARY + b"\r\n")
+PART_BOUNDARY = b"\r\n--" + BOUNDARY + b"\r\n"
+CTNTTYPE = b"Content-Type: image/jpeg\r\nContent-Length: "
+JHEADER = (b"HTTP/1.1 200 OK\r\n"
+           b"Content-disposition: inline; filename=capture.jpg\r\n"
+           b"Content-type: image/jpeg\r\n\r\n")
+
+
+def load_frames(paths, size=None, quality=80):
+    """JPEG frames from files, directories of *.jpg and .mjpeg captures.
+
+    With `size` (width, height) every frame is decoded, resized and
+    re-encoded at `quality`.
+    """
+    frames = []
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, "*.jpg")))
+        else:
+            files = [path]
+        for name in files:
+            with open(name, "rb") as f:
+                data = f.read()
+            if data.startswith(b"\xff\xd8"):
+                frames.append(data)
+            else:
+                frames.extend(bytes(frame) for frame in MjpegParser().feed(data))
+    if not frames:
+        raise ValueError(f"No JPEG frames found in {paths}")
+    if size is not None:
+        resized = []
+        for jpeg in frames:
+            image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            resized.append(cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+        frames = resized
+    return frames
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = self.rfile.readline().decode("latin-1").split()
+        # Drain the request headers
+        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+            pass
+        path = request[1] if len(request) > 1 else "/"
+        camera = self.server.camera
+        try:
+            if path == "/mjpeg/1":
+                camera._stream(self.connection)
+            elif path == "/jpg":
+                camera._single(self.connection)
+            else:
+                body = f"Server is running!\n\nURI: {path}\n".encode()
+                self.connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n"
+                                        b"Content-Length: " + str(len(body)).encode() +
+                                        b"\r\n\r\n" + body)
+        except OSError:
+            pass  # Client went away, like client.connected() turning false
+
+
+class FakeCamera:
+    """Replay `frames` (JPEG bytes) at `fps` with +-`jitter` seconds of random delay."""
+
+    def __init__(self, frames, fps=15.0, jitter=0.0, host="127.0.0.1", port=0, seed=0):
+        self.frames = list(frames)
+        self.fps = fps
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._server = socketserver.ThreadingTCPServer((host, port), _Handler, bind_and_activate=False)
+        self._server.allow_reuse_address = True
+        self._server.daemon_threads = True
+        self._server.server_bind()
+        self._server.server_activate()
+        self._server.camera = self
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Stats
+        self.connections = 0
+        self.frames_sent = 0
+        self.sent_at = []  # Per stream connection: send time of each frame, in order
+
+    @property
+    def address(self):
+        return self._server.server_address
+
+    @property
+    def url(self):
+        return "http://%s:%d/mjpeg/1" % self.address
+
+    @property
+    def jpg_url(self):
+        return "http://%s:%d/jpg" % self.address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-esp32",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _stream(self, sock):
+        with self._lock:
+            self.connections += 1
+            sent_at = []
+            self.sent_at.append(sent_at)
+        sock.sendall(HEADER)
+        sock.sendall(PART_BOUNDARY)
+        interval = 1.0 / self.fps
+        next_frame = time.monotonic()
+        i = 0
+        while not self._stop.is_set():
+            jpeg = self.frames[i % len(self.frames)]
+            i += 1
+            sent_at.append(time.monotonic())
+            sock.sendall(CTNTTYPE)
+            sock.sendall(b"%d\r\n\r\n" % len(jpeg))
+            sock.sendall(jpeg)
+            sock.sendall(PART_BOUNDARY)
+            self.frames_sent += 1
+            next_frame += interval
+            delay = next_frame - time.monotonic()
+            if self.jitter:
+                delay += self._random.uniform(-self.jitter, self.jitter)
+            if delay > 0:
+                self._stop.wait(delay)
+            elif delay < -interval:
+                next_frame = time.monotonic()  # Slow client: don't burst to catch up
+
+    def _single(self, sock):
+        jpeg = self.frames[self.frames_sent % len(self.frames)]
+        sock.sendall(JHEADER)
+        sock.sendall(jpeg)
+        self.frames_sent += 1
+
+
+class FlakyCamera(FakeCamera):
+    """FakeCamera whose stream breaks on demand; /jpg keeps working.
+
+    fault = "drop" closes the open stream once, "stall" makes every stream
+    send bytes that never form a frame until it is reset to None.
+    """
+    fault = None
+
+    def _stream(self, sock):
+        super()._stream(_FaultySocket(sock, self))
+
+
+class _FaultySocket:
+    def __init__(self, sock, camera):
+        self.sock = sock
+        self.camera = camera
+        self.writes = 0
+
+    def sendall(self, data):
+        self.writes += 1
+        fault = self.camera.fault
+        if fault == "drop":
+            self.camera.fault = None
+            raise OSError("connection dropped")
+        if fault == "stall" and self.writes > 2:  # After the HTTP header and first boundary
+            data = b"\0" * 1024
+        self.sock.sendall(data)
+
+
+def parse_size(text):
+    width, height = (int(v) for v in text.lower().split("x"))
+    return width, height
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    ap = argparse.ArgumentParser(description="Fake ESP32-CAM MJPEG server")
+    ap.add_argument("sources", nargs="*", default=[os.path.join(here, "images")],
+                    help="JPEG files, directories of *.jpg or .mjpeg captures")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--fps", type=float, default=15.0)
+    ap.add_argument("--size", type=parse_size, default=None, help="Re-encode frames to WxH")
+    ap.add_argument("--quality", type=int, default=80)
+    ap.add_argument("--jitter", type=float, default=0.0, help="Random +- delay per frame, seconds")
+    args = ap.parse_args()
+
+    frames = load_frames(args.sources, args.size, args.quality)
+    camera = FakeCamera(frames, args.fps, args.jitter, args.host, args.port).start()
+    print(f"Serving {len(frames)} frames at {args.fps} fps on {camera.url} and {camera.jpg_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        camera.stop()
+
+
+if __name__ == "__main__":
+    main()
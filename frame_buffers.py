@@ -0,0 +1,46 @@
+"""Preallocated frame buffers for the display path.
+
+Every displayed frame used to allocate a resized copy, a colour-converted
+copy and a PIL image.  BufferPool hands out arrays of one fixed shape and
+takes them back once the consumer is done, so in steady state the display
+path allocates nothing; the counters show how often a new array was needed.
+"""
+import threading
+
+import numpy as np
+
+
+class BufferPool:
+    def __init__(self, shape, dtype=np.uint8, max_free=4):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.max_free = max_free
+        self._free = []
+        self._lock = threading.Lock()
+        # Stats
+        self.allocated = 0
+        self.reused = 0
+
+    def acquire(self):
+        with self._lock:
+            if self._free:
+                self.reused += 1
+                return self._free.pop()
+            self.allocated += 1
+        return np.empty(self.shape, dtype=self.dtype)
+
+    def release(self, buf):
+        if buf.shape != self.shape:
+            return
+        with self._lock:
+            if len(self._free) < self.max_free:
+                self._free.append(buf)
+
+    def stats(self):
+        return {"allocated": self.allocated, "reused": self.reused}
+
+
+def freeze(frame):
+    """Mark a decoded frame read-only so it can be shared instead of copied."""
+    frame.flags.writeable = False
+    return frame
@@ -0,0 +1,287 @@
+"""Process-wide latency histograms and counters with a Prometheus text endpoint.
+
+The pipeline stages, detection, recognition, rendering and the serial link
+record into the module-level REGISTRY:
+
+    with metrics.stage("detect"):
+        faces = cascade.detectMultiScale(gray)
+    metrics.dropped("front", "processor").inc()
+
+serve(port) exposes everything at http://127.0.0.1:<port>/metrics in the
+Prometheus text format, and RateTracker condenses it into one line for the
+Tk stats overlay.  Recording is a dict lookup plus a few additions under a
+lock, cheap enough to leave on for every frame.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tracing
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+STAGE_SECONDS = "scoutx_stage_seconds"
+LATENCY_SECONDS = "scoutx_frame_latency_seconds"
+FRAMES_TOTAL = "scoutx_frames_total"
+DROPPED_TOTAL = "scoutx_frames_dropped_total"
+STALE_TOTAL = "scoutx_frames_stale_total"
+FPS = "scoutx_stream_fps"
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Counter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield f"{name}{_format_labels(labels)} {self.value}"
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield f"{name}{_format_labels(labels)} {self.value}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            yield f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}"
+        yield f"{name}_sum{_format_labels(labels)} {total}"
+        yield f"{name}_count{_format_labels(labels)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # (name, labels) -> metric
+        self._help = {}
+        self._types = {}
+
+    def _get(self, cls, kind, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = cls(**kwargs)
+                    self._types[name] = kind
+                    if help:
+                        self._help[name] = help
+        return metric
+
+    def counter(self, name, help="", **labels):
+        return self._get(Counter, "counter", name, help, labels)
+
+    def gauge(self, name, help="", **labels):
+        return self._get(Gauge, "gauge", name, help, labels)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, "histogram", name, help, labels, buckets=buckets)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        seen = set()
+        for (name, labels), metric in sorted(self._metrics.items(), key=lambda kv: kv[0]):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {self._types[name]}")
+            lines.extend(metric.samples(name, labels))
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """{(name, labels): value}; histograms give (count, sum)."""
+        result = {}
+        for key, metric in list(self._metrics.items()):
+            if isinstance(metric, Histogram):
+                result[key] = (metric.count, metric.sum)
+            else:
+                result[key] = metric.value
+        return result
+
+
+REGISTRY = Registry()
+
+
+def counter(name, help="", **labels):
+    return REGISTRY.counter(name, help, **labels)
+
+
+def gauge(name, help="", **labels):
+    return REGISTRY.gauge(name, help, **labels)
+
+
+def histogram(name, help="", **labels):
+    return REGISTRY.histogram(name, help, **labels)
+
+
+def stage_histogram(stage):
+    return REGISTRY.histogram(STAGE_SECONDS, "Time spent per frame in each processing stage",
+                              stage=stage)
+
+
+def frames(stream):
+    return REGISTRY.counter(FRAMES_TOTAL, "Frames received from the camera", stream=stream)
+
+
+def dropped(stream, queue):
+    return REGISTRY.counter(DROPPED_TOTAL, "Frames dropped by a full pipeline queue",
+                            stream=stream, queue=queue)
+
+
+def stale(where):
+    return REGISTRY.counter(STALE_TOTAL, "Processed frames replaced by a newer one before use",
+                            where=where)
+
+
+def stream_fps(stream):
+    return REGISTRY.gauge(FPS, "Frames per second received over the last second", stream=stream)
+
+
+def latency():
+    return REGISTRY.histogram(LATENCY_SECONDS, "Frame arrival to displayed / final result")
+
+
+@contextmanager
+def stage(name):
+    """Time one pass through stage `name`; also a trace span of the current frame."""
+    start = tracing.now()
+    try:
+        yield
+    finally:
+        end = tracing.now()
+        stage_histogram(name).observe(end - start)
+        tracing.TRACER.span(name, start, end)
+
+
+def serve(port=9108, host="127.0.0.1", registry=REGISTRY):
+    """Serve /metrics on a daemon thread; returns the server (call shutdown() to stop).
+
+    If the port cannot be bound (e.g. another app is already serving it),
+    prints a warning and returns None: metrics are never worth a crash.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        print(f"[metrics] not serving on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class RateTracker:
+    """Per-interval view of the registry for overlays and periodic prints.
+
+    Every update() compares against the previous snapshot, so the figures
+    describe the last interval instead of the whole run.
+    """
+
+    STAGES = ("read", "decode", "detect", "embed", "match", "render", "serial_send")
+
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self._last = registry.snapshot()
+        self._t = time.monotonic()
+
+    def update(self):
+        """(seconds since the last call, {(name, labels): delta}); histograms give (count, sum)."""
+        now = time.monotonic()
+        current = self.registry.snapshot()
+        deltas = {}
+        for key, value in current.items():
+            old = self._last.get(key)
+            if isinstance(value, tuple):
+                old = old or (0, 0.0)
+                deltas[key] = (value[0] - old[0], value[1] - old[1])
+            else:
+                deltas[key] = value - (old or 0)
+        elapsed, self._last, self._t = now - self._t, current, now
+        return elapsed, deltas
+
+    def format(self):
+        """One compact line: fps, average ms per stage, dropped / stale frames."""
+        elapsed, deltas = self.update()
+        totals = {}
+        for (name, labels), value in deltas.items():
+            if name == STAGE_SECONDS:
+                stage = dict(labels)["stage"]
+                count, total = totals.get(stage, (0, 0.0))
+                totals[stage] = (count + value[0], total + value[1])
+            elif not isinstance(value, tuple):
+                totals[name] = totals.get(name, 0) + value
+        fps = totals.get(FRAMES_TOTAL, 0) / elapsed if elapsed > 0 else 0.0
+        parts = [f"{fps:.1f} fps in"]
+        for stage in self.STAGES:
+            count, total = totals.get(stage, (0, 0.0))
+            if count:
+                parts.append(f"{stage} {total / count * 1000:.0f}ms")
+        latency = deltas.get((LATENCY_SECONDS, ()))
+        if latency and latency[0]:
+            parts.append(f"latency {latency[1] / latency[0] * 1000:.0f}ms")
+        parts.append(f"dropped {totals.get(DROPPED_TOTAL, 0)} stale {totals.get(STALE_TOTAL, 0)}")
+        return "  ".join(parts)
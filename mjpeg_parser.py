@@ -0,0 +1,177 @@
+"""Incremental parser for the ESP32-CAM multipart MJPEG stream.
+
+The firmware (esp32_camera_mjpeg.ino, handle_jpg_stream) sends every frame as
+
+    \\r\\n--123456789000000000000987654321\\r\\n
+    Content-Type: image/jpeg\\r\\nContent-Length: <n>\\r\\n\\r\\n
+    <n bytes of JPEG>
+
+so once the part headers are read we know exactly how many bytes to copy.
+Part headers are collected in one reusable bytearray and scanning resumes
+where it stopped, so each byte of the stream is looked at a constant number
+of times.  Each JPEG body is copied once, straight from the network chunk
+into a frame-sized bytearray that is handed out as a memoryview and never
+touched again by the parser.
+
+Streams without a Content-Length header (other cameras, raw JPEG dumps) fall
+back to scanning for the SOI/EOI markers, again resuming from the last
+scanned offset instead of from 0.
+"""
+
+BOUNDARY = b"123456789000000000000987654321"
+SOI = b"\xff\xd8"
+EOI = b"\xff\xd9"
+
+_HEADER_END = b"\r\n\r\n"
+_HEADERS, _BODY, _MARKERS = range(3)
+
+
+def encode_part(jpeg, boundary=BOUNDARY):
+    """Frame one JPEG exactly the way handle_jpg_stream() does."""
+    return (b"Content-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode() +
+            b"\r\n\r\n" + bytes(jpeg) + b"\r\n--" + boundary + b"\r\n")
+
+
+def stream_preamble(boundary=BOUNDARY):
+    """The first boundary line the firmware writes after its HTTP header."""
+    return b"\r\n--" + boundary + b"\r\n"
+
+
+class MjpegParser:
+    """Feed it network chunks, get complete JPEG frames back.
+
+    feed() returns a list of memoryviews.  Each view wraps its own buffer,
+    so it stays valid after later feed() calls and can be passed straight to
+    np.frombuffer() or queued to another thread.
+    """
+
+    def __init__(self, max_frame_size=4 * 1024 * 1024):
+        self.max_frame_size = max_frame_size
+        self._buf = bytearray()
+        self._scan = 0
+        self._state = _HEADERS
+        self._frame = None
+        self._filled = 0
+        self._soi = -1
+        # Stats
+        self.frames = 0
+        self.bytes_in = 0
+        self.resyncs = 0
+
+    def reset(self):
+        self._buf.clear()
+        self._scan = 0
+        self._state = _HEADERS
+        self._frame = None
+        self._filled = 0
+        self._soi = -1
+
+    def iter_frames(self, chunks):
+        """Yield frames from an iterable of chunks, e.g. r.iter_content()."""
+        for chunk in chunks:
+            for frame in self.feed(chunk):
+                yield frame
+
+    def feed(self, chunk):
+        frames = []
+        data = memoryview(chunk)
+        self.bytes_in += len(data)
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self._state == _BODY:
+                # Copy straight from the chunk into the frame buffer.
+                n = min(len(self._frame) - self._filled, end - pos)
+                self._frame[self._filled:self._filled + n] = data[pos:pos + n]
+                self._filled += n
+                pos += n
+                if self._filled == len(self._frame):
+                    frames.append(memoryview(self._frame))
+                    self.frames += 1
+                    self._frame = None
+                    self._state = _HEADERS
+                continue
+
+            # Header and marker scanning work on the reusable buffer.
+            self._buf += data[pos:]
+            pos = end
+            while True:
+                state = self._state
+                if state == _HEADERS:
+                    self._parse_headers()
+                elif state == _MARKERS:
+                    self._scan_markers(frames)
+                if self._state == _BODY or self._state == state:
+                    break
+            if self._state == _BODY and self._buf:
+                # The rest of the buffer belongs to the frame body.
+                data = memoryview(bytes(self._buf))
+                self._buf.clear()
+                self._scan = 0
+                pos = 0
+                end = len(data)
+            elif len(self._buf) > self.max_frame_size:
+                self.resyncs += 1
+                self.reset()
+        return frames
+
+    def _parse_headers(self):
+        buf = self._buf
+        # Start a little before the last scan so a split "\r\n\r\n" is found.
+        start = max(self._scan - 3, 0)
+        hdr_end = buf.find(_HEADER_END, start)
+        soi = buf.find(SOI, start)
+        if soi != -1 and (hdr_end == -1 or soi < hdr_end):
+            # A JPEG starts before any header block: no multipart framing.
+            del buf[:soi]
+            self._enter_markers()
+            return
+        if hdr_end == -1:
+            self._scan = len(buf)
+            return
+
+        length = None
+        for line in bytes(buf[:hdr_end]).split(b"\r\n"):
+            name, sep, value = line.partition(b":")
+            if sep and name.strip().lower() == b"content-length":
+                try:
+                    length = int(value.strip())
+                except ValueError:
+                    length = None
+        del buf[:hdr_end + len(_HEADER_END)]
+        self._scan = 0
+
+        if length is None or length <= 0 or length > self.max_frame_size:
+            self._enter_markers()
+            return
+        self._frame = bytearray(length)
+        self._filled = 0
+        self._state = _BODY
+
+    def _enter_markers(self):
+        self._state = _MARKERS
+        self._scan = 0
+        self._soi = -1
+
+    def _scan_markers(self, frames):
+        buf = self._buf
+        if self._soi == -1:
+            soi = buf.find(SOI, max(self._scan - 1, 0))
+            if soi == -1:
+                # Keep the last byte in case it is the first half of SOI.
+                del buf[:-1]
+                self._scan = len(buf)
+                return
+            self._soi = soi
+            self._scan = soi + 2
+        eoi = buf.find(EOI, max(self._scan - 1, self._soi + 2))
+        if eoi == -1:
+            self._scan = len(buf)
+            return
+        frames.append(memoryview(bytearray(buf[self._soi:eoi + 2])))
+        self.frames += 1
+        del buf[:eoi + 2]
+        # The next part may carry headers again; let the header scanner decide.
+        self._state = _HEADERS
+        self._scan = 0
+        self._soi = -1
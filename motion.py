@@ -0,0 +1,88 @@
+"""Cheap change detector that gates face detection on static scenes.
+
+The robot mostly looks at an empty corridor.  MotionGate shrinks each frame
+to a thumbnail, compares it with a running-average background and reports
+whether enough of it changed; detection and recognition only need to run
+on those frames, and on every frame while the last detection found a face,
+known or not, so a person standing still stays detected.  The background
+adapts slowly, so lighting drifts do not count as motion.
+"""
+import cv2
+import numpy as np
+
+
+class MotionGate:
+    """Frame differencing on a downsampled grayscale image.
+
+        if motion.update(packet.gray) or faces_present:
+            ...detect...
+
+    `pixel_threshold` is the per-pixel gray level change that counts,
+    `min_changed` the fraction of thumbnail pixels that must change.  After
+    motion, `hold` more frames are let through so a person who stops moving
+    is still picked up, and every `refresh` frames one frame is let through
+    regardless (0 disables).  `every` prints the skip rate like StageTimer.
+    """
+
+    def __init__(self, width=80, pixel_threshold=25, min_changed=0.01, alpha=0.05,
+                 hold=10, refresh=50, every=500):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.alpha = alpha
+        self.hold = hold
+        self.refresh = refresh
+        self.every = every
+        self._background = None
+        self._hold_left = 0
+        self._since_pass = 0
+        self.changed = 0.0  # Fraction of the thumbnail that changed last frame
+        # Stats
+        self.frames = 0
+        self.skipped = 0
+
+    def _thumbnail(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.width, max(int(height * self.width / width), 1))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def update(self, frame):
+        """Feed one gray or BGR frame; True if detection should run on it."""
+        small = self._thumbnail(frame)
+        self.frames += 1
+        if self._background is None or self._background.shape != small.shape:
+            self._background = small.astype(np.float32)
+            moving = True
+        else:
+            diff = cv2.absdiff(small, cv2.convertScaleAbs(self._background))
+            self.changed = np.count_nonzero(diff > self.pixel_threshold) / diff.size
+            moving = self.changed >= self.min_changed
+            cv2.accumulateWeighted(small, self._background, self.alpha)
+
+        if moving:
+            self._hold_left = self.hold
+        elif self._hold_left > 0:
+            self._hold_left -= 1
+            moving = True
+        elif self.refresh and self._since_pass + 1 >= self.refresh:
+            moving = True
+
+        if moving:
+            self._since_pass = 0
+        else:
+            self._since_pass += 1
+            self.skipped += 1
+        if self.every and self.frames % self.every == 0:
+            print(f"[motion] {self.format()}")
+        return moving
+
+    def stats(self):
+        return {"frames": self.frames, "skipped": self.skipped,
+                "skipped_pct": 100.0 * self.skipped / self.frames if self.frames else 0.0}
+
+    def format(self):
+        s = self.stats()
+        return f"skipped {s['skipped']} of {s['frames']} frames ({s['skipped_pct']:.1f}%)"
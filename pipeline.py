@@ -0,0 +1,316 @@
+"""Staged frame pipeline: reader -> decoder -> processor -> renderer.
+
+Every stage runs in its own thread and hands frames to the next one through
+a small LatestQueue.  When a downstream stage is slower than the one feeding
+it, the oldest waiting frame is dropped instead of blocking, so the reader
+keeps draining the ESP32 socket and whatever reaches the screen is always
+the newest frame available.
+"""
+import collections
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import metrics
+import tracing
+
+
+class LatestQueue:
+    """Bounded queue that drops the oldest item instead of blocking on put()."""
+
+    def __init__(self, maxsize=1, counter=None):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._counter = counter  # Optional metrics.Counter of dropped items
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+                if self._counter is not None:
+                    self._counter.inc()
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, None once closed and drained.
+
+        Raises queue.Empty if nothing arrives within `timeout` seconds.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                raise queue.Empty
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# cv2.imdecode flags by reduction factor: the JPEG decoder skips most of
+# the IDCT work for 1/2, 1/4 and 1/8 size output.
+GRAY_DECODE = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+               4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+COLOR_DECODE = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2,
+                4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def jpeg_size(jpeg):
+    """(width, height) from the SOF header of a JPEG, without decoding it."""
+    data = bytes(jpeg[:65536])
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            break
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        length = (data[i + 2] << 8) | data[i + 3]
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = (data[i + 5] << 8) | data[i + 6]
+            width = (data[i + 7] << 8) | data[i + 8]
+            return width, height
+        i += 2 + length
+    return None
+
+
+class FramePacket:
+    """One frame travelling through the pipeline.
+
+    `image` is the full-resolution BGR frame.  For JPEG packets it is only
+    decoded when first accessed, so stages that can work on `gray` (see
+    Pipeline's gray_reduce) never pay for a full colour decode.
+    """
+
+    __slots__ = ("seq", "stream", "t_arrival", "jpeg", "_image", "gray", "gray_reduce", "faces",
+                 "recognized")
+
+    def __init__(self, seq, jpeg=None, image=None, stream=None):
+        self.seq = seq
+        self.stream = stream
+        self.t_arrival = tracing.now()  # When the reader had the whole frame
+        self.jpeg = jpeg
+        self._image = image
+        self.gray = None  # Grayscale frame at 1/gray_reduce resolution
+        self.gray_reduce = 1
+        self.faces = []  # (top, right, bottom, left, name) in image coordinates
+        self.recognized = False
+
+    @property
+    def image(self):
+        if self._image is None and self.jpeg is not None:
+            self._image = _imdecode(self.jpeg, cv2.IMREAD_COLOR)
+        return self._image
+
+    @image.setter
+    def image(self, value):
+        self._image = value
+
+    @property
+    def decoded(self):
+        """True once the full-resolution colour frame exists."""
+        return self._image is not None
+
+    def frame_size(self):
+        """(width, height) of the full-resolution frame, decoded or not."""
+        if self._image is not None:
+            return self._image.shape[1], self._image.shape[0]
+        size = jpeg_size(self.jpeg)
+        if size is None:
+            size = self.image.shape[1], self.image.shape[0]
+        return size
+
+    def preview(self, size):
+        """A BGR frame at least `size` (width, height) large.
+
+        Uses the full frame if it was already decoded, otherwise decodes the
+        JPEG at the largest reduction that still covers `size`; the reduced
+        frame is not kept.
+        """
+        if self._image is not None or self.jpeg is None:
+            return self.image
+        width, height = self.frame_size()
+        reduce = 1
+        while reduce < 8 and width // (reduce * 2) >= size[0] and height // (reduce * 2) >= size[1]:
+            reduce *= 2
+        if reduce == 1:
+            return self.image
+        return _imdecode(self.jpeg, COLOR_DECODE[reduce])
+
+
+def _imdecode(jpeg, flags):
+    data = np.frombuffer(jpeg, dtype=np.uint8)
+    if data.size == 0:
+        return None
+    return cv2.imdecode(data, flags)
+
+
+def decode_jpeg(packet, gray_reduce=None):
+    """Decoder stage.  Decodes the colour frame, or only a reduced grayscale
+    frame when `gray_reduce` (1, 2, 4 or 8) is given."""
+    if gray_reduce is None:
+        return packet if packet.image is not None else None
+    if packet.decoded:
+        gray = cv2.cvtColor(packet.image, cv2.COLOR_BGR2GRAY)
+        if gray_reduce != 1:
+            gray = cv2.resize(gray, (0, 0), fx=1.0 / gray_reduce, fy=1.0 / gray_reduce,
+                              interpolation=cv2.INTER_AREA)
+    else:
+        gray = _imdecode(packet.jpeg, GRAY_DECODE[gray_reduce])
+    if gray is None:
+        return None
+    packet.gray = gray
+    packet.gray_reduce = gray_reduce
+    return packet
+
+
+def capture_frames(cap):
+    """Adapt a cv2.VideoCapture into a pipeline source of decoded images."""
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            print("Failed to read frame from stream.")
+            time.sleep(0.1)
+            continue
+        yield frame
+
+
+# Stage thread name -> "stage" label of metrics.STAGE_SECONDS
+STAGE_METRICS = {"decoder": "decode", "processor": "process", "renderer": "render"}
+
+
+class Stage(threading.Thread):
+    """Apply `func` to every item of `inbox`; non-None results go to `outbox`."""
+
+    def __init__(self, name, func, inbox, outbox=None):
+        super().__init__(name=name, daemon=True)
+        self.func = func
+        self.inbox = inbox
+        self.outbox = outbox
+        self.metric = STAGE_METRICS.get(name, name)
+        self.histogram = metrics.stage_histogram(self.metric)
+        self.processed = 0
+
+    def run(self):
+        while True:
+            item = self.inbox.get()
+            if item is None:
+                break
+            start = tracing.now()
+            try:
+                with tracing.TRACER.frame(item):
+                    result = self.func(item)
+            except Exception as e:
+                print(f"{self.name} stage error:", e)
+                continue
+            end = tracing.now()
+            self.histogram.observe(end - start)
+            tracing.TRACER.span(self.metric, start, end, tracing.frame_args(item))
+            self.processed += 1
+            if result is not None and self.outbox is not None:
+                self.outbox.put(result)
+        if self.outbox is not None:
+            self.outbox.close()
+
+
+class Pipeline:
+    """Wire a frame source through decode, process and render stages.
+
+    `source` is a callable returning an iterable of JPEG buffers (e.g.
+    MjpegParser().iter_frames(...)) or of already decoded BGR images (see
+    capture_frames()).  It is called on the reader thread so a slow
+    connect never blocks the caller.  `process` and `render` take and return
+    a FramePacket; either may be None.
+
+    With `gray_reduce` (1, 2, 4 or 8, or a callable returning one per frame)
+    the decoder only produces packet.gray at that reduction and the colour
+    frame is decoded later, if a stage asks for packet.image.
+
+    `name` labels this stream's frame, drop and fps metrics.
+    """
+
+    def __init__(self, source, process=None, render=None, queue_size=1, gray_reduce=None,
+                 name="camera"):
+        self.source = source
+        self.gray_reduce = gray_reduce
+        self.name = name
+        self._stop = threading.Event()
+        self.frames_in = 0
+        self._frames_metric = metrics.frames(name)
+        self._fps_metric = metrics.stream_fps(name)
+        stages = [("decoder", self._decode), ("processor", process), ("renderer", render)]
+        stages = [(name, func) for name, func in stages if func is not None]
+        # Queues are keyed by the stage that consumes them.
+        self.queues = {}
+        self.threads = [threading.Thread(target=self._read, name="reader", daemon=True)]
+        for i, (stage, func) in enumerate(stages):
+            if i == 0:
+                inbox = LatestQueue(queue_size, metrics.dropped(name, stage))
+            outbox = (LatestQueue(queue_size, metrics.dropped(name, stages[i + 1][0]))
+                      if i < len(stages) - 1 else None)
+            self.queues[stage] = inbox
+            self.threads.append(Stage(stage, func, inbox, outbox))
+            inbox = outbox
+
+    def _decode(self, packet):
+        reduce = self.gray_reduce() if callable(self.gray_reduce) else self.gray_reduce
+        return decode_jpeg(packet, reduce)
+
+    def _read(self):
+        inbox = self.queues["decoder"]
+        fps_start, fps_frames = time.monotonic(), 0
+        t_read = tracing.now()
+        try:
+            for item in self.source():
+                if self._stop.is_set():
+                    break
+                self.frames_in += 1
+                self._frames_metric.inc()
+                fps_frames += 1
+                now = time.monotonic()
+                if now - fps_start >= 1.0:
+                    self._fps_metric.set(fps_frames / (now - fps_start))
+                    fps_start, fps_frames = now, 0
+                if isinstance(item, np.ndarray):
+                    packet = FramePacket(self.frames_in, image=item, stream=self.name)
+                else:
+                    packet = FramePacket(self.frames_in, jpeg=item, stream=self.name)
+                # Waiting on the source for this frame
+                tracing.TRACER.span("read", t_read, packet.t_arrival, tracing.frame_args(packet))
+                inbox.put(packet)
+                t_read = tracing.now()
+        except Exception as e:
+            print("Stream reader error:", e)
+        finally:
+            inbox.close()
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for q in self.queues.values():
+            q.close()
+
+    def join(self, timeout=None):
+        for t in self.threads:
+            t.join(timeout)
+
+    def stats(self):
+        return {"frames_in": self.frames_in,
+                "dropped": {name: q.dropped for name, q in self.queues.items()}}
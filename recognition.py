@@ -0,0 +1,221 @@
+"""Helpers shared by the face detection / recognition loops."""
+import collections
+
+import cv2
+import face_recognition
+
+import metrics
+import tracing
+
+
+def face_area(location):
+    top, right, bottom, left = location
+    return (bottom - top) * (right - left)
+
+
+def largest_faces(locations, limit=None):
+    """Return the `limit` largest (top, right, bottom, left) boxes, largest first.
+
+    With limit=None every box is returned unchanged, in detection order.
+    """
+    if limit is None or len(locations) <= limit:
+        return list(locations)
+    return sorted(locations, key=face_area, reverse=True)[:limit]
+
+
+def haar_to_locations(faces):
+    """Convert Haar (x, y, w, h) boxes to face_recognition (top, right, bottom, left)."""
+    return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in faces]
+
+
+def recognize_faces(frame, locations, known_faces):
+    """Encode and match all faces of a BGR frame in one batch.
+
+    The frame is converted to RGB once and every box goes through a single
+    face_encodings() call, however many faces there are.  Returns a list of
+    (top, right, bottom, left, name) with name None for unknown faces.
+
+    `frame` may also be a callable returning the frame (e.g. a lazily decoded
+    packet image); it is only called when there is a face to encode.
+    """
+    if len(locations) == 0:
+        return []
+    if callable(frame):
+        frame = frame()
+    with metrics.stage("embed"):
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        encodings = face_recognition.face_encodings(rgb, locations)
+    with metrics.stage("match"):
+        names, _ = known_faces.match(encodings)
+    return [tuple(location) + (name,) for location, name in zip(locations, names)]
+
+
+def recognize_tracked(frame, locations, known_faces, tracker, verify=None):
+    """Like recognize_faces(), but reuse identities from a FaceTracker.
+
+    Only faces on new tracks, or whose identity is older than
+    tracker.reembed_every detections, are encoded; the rest keep the name their
+    track already has.  Names `verify` returns True for are never reused
+    (see FaceTracker.stale()).
+    """
+    tracks = tracker.update(locations)
+    stale = tracker.stale(tracks, verify)
+    results = recognize_faces(frame, [t.box for t in stale], known_faces)
+    for track, result in zip(stale, results):
+        track.set_identity(result[4])
+    return [t.box + (t.name,) for t in tracks]
+
+
+class PooledRecognizer:
+    """Tracked recognition with the embeddings computed on a RecognitionPool.
+
+    push() detects nothing itself: it takes a frame's face boxes, sends the
+    faces that need embedding to the pool and returns the frames whose
+    results are complete, oldest first, as (packet, faces) pairs.  Up to
+    `depth` frames are in flight at once, which is what keeps every worker
+    busy.  Frames pushed with locations=None (detection skipped) reuse the
+    faces of the frame before them and keep packet.recognized False.  Give
+    each stream sharing a pool its own `stream` name so their frame numbers
+    do not collide.  `verify` is passed on to FaceTracker.stale().
+    """
+
+    def __init__(self, pool, known_faces, tracker, depth=None, stream=None, verify=None):
+        self.pool = pool
+        self.known_faces = known_faces
+        self.tracker = tracker
+        self.depth = depth or pool.workers
+        self.stream = stream
+        self.verify = verify
+        self._in_flight = collections.deque()
+        self._last_faces = []
+
+    def _key(self, packet):
+        return packet.seq if self.stream is None else (self.stream, packet.seq)
+
+    def push(self, packet, locations):
+        tracks = stale = None
+        if locations is not None:
+            tracks = self.tracker.update(locations)
+            stale = self.tracker.stale(tracks, self.verify)
+            # A frame whose colour decode failed keeps the tracked names;
+            # its stale tracks are embedded on a later frame
+            if (stale and packet.image is not None and
+                    self.pool.submit(self._key(packet), packet.image, [t.box for t in stale])):
+                for track in stale:
+                    # Claimed: the identity arrives with the pool result
+                    track.detections_since_embed = 0
+            else:
+                stale = None
+        boxes = [t.box for t in tracks] if tracks is not None else None
+        self._in_flight.append((packet, boxes, tracks, stale))
+
+        done = []
+        while self._in_flight:
+            packet, boxes, tracks, stale = self._in_flight[0]
+            if stale and len(self._in_flight) <= self.depth and not self.pool.ready(self._key(packet)):
+                break
+            self._in_flight.popleft()
+            if stale:
+                encodings = self.pool.result(self._key(packet))
+                found = [(t, e) for t, e in zip(stale, encodings) if e is not None]
+                if found:
+                    with metrics.stage("match"):
+                        names, _ = self.known_faces.match([e for _, e in found])
+                    for (track, _), name in zip(found, names):
+                        track.name = name
+            if boxes is not None:
+                self._last_faces = [box + (t.name,) for box, t in zip(boxes, tracks)]
+                packet.recognized = any(face[4] is not None for face in self._last_faces)
+            done.append((packet, self._last_faces))
+        return done
+
+
+class StreamRecognizer:
+    """The per-frame detection and recognition loop of one camera stream.
+
+    `motion` skips detection on static scenes while no face is on screen,
+    `scheduler` picks the detection scale, cascade parameters and how many
+    frames to skip, and `tracker` lets faces keep their identity between
+    embeddings (see recognize_tracked()).  With `pool` the embeddings run on
+    a RecognitionPool through a PooledRecognizer keyed by `stream`.
+
+    Every frame whose results are complete gets its labelled boxes in
+    packet.faces and sends "Open" through `send_command(command, key)` for
+    each person recognized in it; `events`, an EventBuffer, saves clips of
+    recognized and unknown faces.  `would_open(name)` tells whether an Open
+    for `name` would be sent now; such faces are embedded again instead of
+    keeping their tracked name, so the door never opens for whoever stepped
+    into a known person's box.  Without it every named face is re-embedded
+    before its Open.
+    """
+
+    def __init__(self, face_cascade, known_faces, scheduler, tracker, motion, send_command,
+                 would_open=None, events=None, pool=None, stream=None):
+        self.face_cascade = face_cascade
+        self.known_faces = known_faces
+        self.scheduler = scheduler
+        self.tracker = tracker
+        self.motion = motion
+        self.send_command = send_command
+        self.would_open = would_open or (lambda name: True)
+        self.events = events
+        self.pooled = None
+        if pool is not None:
+            self.pooled = PooledRecognizer(pool, known_faces, tracker, stream=stream,
+                                           verify=self.would_open)
+        self.last_faces = []  # Results of the last detection, reused on skipped frames
+
+    def process(self, packet):
+        """Run one decoded packet; returns the newest completed frame, or None.
+
+        Without a pool that is always `packet`.  With one it may be an older
+        frame, or several frames may complete at once: each of them sends
+        its own Opens and triggers its clips, but only the newest is
+        returned, as the renderer would drop the older ones anyway.
+        """
+        done = None
+        if (self.motion.update(packet.gray) or self.last_faces) and self.scheduler.should_detect():
+            # Detection and recognition are timed together: both count toward
+            # the frame budget the scheduler adapts to.
+            with self.scheduler.timed():
+                # Reduced grayscale straight from the JPEG decoder
+                faces = self.scheduler.detect_haar(self.face_cascade, packet.gray,
+                                                   packet.gray_reduce)
+                locations = haar_to_locations(faces)
+                if self.pooled is not None:
+                    # push() waits for the oldest frame once `depth` frames
+                    # are in flight, so a pool that cannot keep up shows in
+                    # the timing too.
+                    done = self.pooled.push(packet, locations)
+                else:
+                    self.last_faces = recognize_tracked(lambda: packet.image, locations,
+                                                        self.known_faces, self.tracker,
+                                                        self.would_open)
+                    packet.recognized = any(face[4] is not None for face in self.last_faces)
+        elif self.pooled is not None:
+            done = self.pooled.push(packet, None)
+        if self.pooled is None:
+            done = [(packet, self.last_faces)]
+        elif done:
+            self.last_faces = done[-1][1]
+        for completed, faces in done:
+            self._act(completed, faces)
+        return done[-1][0] if done else None
+
+    def _act(self, packet, faces):
+        for (top, right, bottom, left, name) in faces:
+            name = "Unknown" if name is None else name.upper()
+            packet.faces.append((top, right, bottom, left, name))
+        # Only frames that went through detection open the door, at most once
+        # per cooldown for each person
+        if packet.recognized:
+            for name in {face[4] for face in faces if face[4] is not None}:
+                if self.send_command("Open", key=name):
+                    # Arrival-to-Open latency of this frame
+                    tracing.mark("open", packet)
+                if self.events is not None:
+                    # Recorded even while the Open itself is cooling down
+                    self.events.trigger("open", name)
+        if self.events is not None and any(face[4] is None for face in faces):
+            # Consecutive frames extend the same clip
+            self.events.trigger("unknown")
@@ -0,0 +1,329 @@
+"""Record the camera's JPEG frames as they arrive, without re-encoding.
+
+    recorder = Recorder("recordings", segment_seconds=300, max_bytes=20 * 2**30)
+    pipeline = Pipeline(recorder.tee(stream_client.frames), ...)
+
+tee() hands every frame from the multipart parser to the recorder on the
+reader thread, which only appends it to an in-memory queue; a writer thread
+does the disk I/O.  Frames are written exactly as the firmware framed them
+(mjpeg_parser.encode_part), so every segment is a valid .mjpeg capture that
+fake_esp32.py can replay, and next to it a .idx file holds one
+(timestamp, offset, length) record per frame so any moment can be found and
+read back without scanning.  Segments rotate every `segment_seconds`; when
+the Recorder starts, at each rotation and at least every
+`retention_interval` seconds in between, the oldest finished segments in
+the directory -- of every camera recording into it -- are deleted while
+they add up to more than `max_bytes` or are older than `max_age` seconds.
+
+    python recorder.py recordings --list
+    python recorder.py recordings --from 14:02:00 --to 14:03:30 --out clip.mjpeg
+    python recorder.py recordings --at 14:02:10 --out frame.jpg
+"""
+import argparse
+import bisect
+import collections
+import datetime
+import glob
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from mjpeg_parser import BOUNDARY, stream_preamble
+
+INDEX_RECORD = struct.Struct("<dQI")  # Wall-clock time, offset of the JPEG, length
+PART_TRAILER = b"\r\n--" + BOUNDARY + b"\r\n"
+
+
+def _part_header(length):
+    return b"Content-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % length
+
+
+class Recorder:
+    """Append JPEG frames to rotating .mjpeg segments in `directory`.
+
+    write() never blocks: when the disk falls more than `queue_size` frames
+    behind, the oldest queued frames are dropped and counted.
+    """
+
+    def __init__(self, directory, segment_seconds=300.0, max_bytes=None, max_age=None,
+                 prefix="cam", queue_size=256, retention_interval=60.0):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention_interval = retention_interval
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+        self._queue = collections.deque(maxlen=queue_size)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._segment = None  # (data file, index file, start time)
+        self._next_retention = 0.0
+        # Stats
+        self.frames = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.segments = 0
+        self.deleted = 0
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{prefix}", daemon=True)
+        self._thread.start()
+
+    def write(self, jpeg, timestamp=None):
+        """Queue one frame; `jpeg` must not be modified afterwards."""
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append((time.time() if timestamp is None else timestamp, jpeg))
+            self._cond.notify()
+
+    def tee(self, source):
+        """Wrap a Pipeline source so every JPEG it yields is also recorded."""
+        def frames():
+            for frame in source():
+                if not isinstance(frame, np.ndarray):  # Decoded images are not recorded
+                    self.write(frame)
+                yield frame
+        return frames
+
+    def _run(self):
+        # A restart can find the directory over its limits already
+        self._retain()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed,
+                                    max(self._next_retention - time.monotonic(), 0))
+                if self._closed and not self._queue:
+                    break
+                batch = list(self._queue)
+                self._queue.clear()
+            if time.monotonic() >= self._next_retention:
+                # Long segments would otherwise leave it over them until the rotation
+                self._retain()
+            if not batch:
+                continue
+            try:
+                for timestamp, jpeg in batch:
+                    self._append(timestamp, jpeg)
+                data, index, _ = self._segment
+                data.flush()
+                index.flush()
+            except OSError as e:
+                print(f"Recorder {self.directory}: {e}")
+                self._close_segment()
+        self._close_segment()
+
+    def _append(self, timestamp, jpeg):
+        if self._segment is None or timestamp - self._segment[2] >= self.segment_seconds:
+            self._close_segment()
+            self._open_segment(timestamp)
+        data, index, _ = self._segment
+        header = _part_header(len(jpeg))
+        offset = data.tell() + len(header)
+        data.write(header)
+        data.write(jpeg)
+        data.write(PART_TRAILER)
+        index.write(INDEX_RECORD.pack(timestamp, offset, len(jpeg)))
+        self.frames += 1
+        self.bytes_written += len(header) + len(jpeg) + len(PART_TRAILER)
+
+    def _open_segment(self, timestamp):
+        stamp = datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.directory, f"{self.prefix}-{stamp}")
+        data = open(base + ".mjpeg", "ab")
+        if data.tell() == 0:
+            data.write(stream_preamble())
+        self._segment = (data, open(base + ".idx", "ab"), timestamp)
+        self.segments += 1
+        self._retain()
+
+    def _close_segment(self):
+        if self._segment is not None:
+            data, index, _ = self._segment
+            self._segment = None
+            data.close()
+            index.close()
+
+    def _retain(self):
+        try:
+            self._apply_retention()
+        except OSError as e:
+            print(f"Recorder {self.directory}: {e}")
+        self._next_retention = time.monotonic() + self.retention_interval
+
+    def _apply_retention(self):
+        """Delete the oldest finished segments of the directory beyond max_bytes / max_age.
+
+        The newest segment of every camera may still be open in another
+        Recorder, so it is left alone and does not count towards max_bytes.
+        """
+        segments = list_segments(self.directory)
+        newest = {_segment_prefix(path): path for path in segments}
+        in_use = set(newest.values())
+        if self._segment is not None:
+            in_use.add(self._segment[0].name)
+        segments = [path for path in segments if path not in in_use]
+        sizes = {path: _segment_bytes(path) for path in segments}
+        total = sum(sizes.values())
+        now = time.time()
+        for path in segments:  # Oldest first
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            too_old = self.max_age is not None and now - os.path.getmtime(path) > self.max_age
+            if not (too_big or too_old):
+                break
+            for name in (path, _index_path(path)):
+                if os.path.exists(name):
+                    os.remove(name)
+            total -= sizes[path]
+            self.deleted += 1
+
+    def close(self, timeout=5.0):
+        """Write out whatever is queued and close the current segment."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {"frames": self.frames, "bytes": self.bytes_written, "dropped": self.dropped,
+                "segments": self.segments, "deleted": self.deleted, "queued": len(self._queue)}
+
+
+def write_clip(path, jpegs):
+    """Write JPEG frames to `path` as a .mjpeg capture; returns the frame count."""
+    count = 0
+    with open(path, "wb") as f:
+        f.write(stream_preamble())
+        for jpeg in jpegs:
+            f.write(_part_header(len(jpeg)))
+            f.write(jpeg)
+            f.write(PART_TRAILER)
+            count += 1
+    return count
+
+
+def _index_path(segment):
+    return os.path.splitext(segment)[0] + ".idx"
+
+
+def _segment_bytes(segment):
+    return sum(os.path.getsize(p) for p in (segment, _index_path(segment)) if os.path.exists(p))
+
+
+def _segment_prefix(segment):
+    return os.path.basename(segment).rsplit("-", 2)[0]
+
+
+def _segment_stamp(segment):
+    """"<prefix>-YYYYmmdd-HHMMSS.mjpeg" -> "YYYYmmdd-HHMMSS", which sorts by start time."""
+    return "-".join(os.path.splitext(os.path.basename(segment))[0].rsplit("-", 2)[1:])
+
+
+def list_segments(directory, prefix="*"):
+    """Segment paths in `directory`, oldest first across all cameras."""
+    paths = glob.glob(os.path.join(directory, f"{prefix}-*.mjpeg"))
+    return sorted(paths, key=lambda path: (_segment_stamp(path), path))
+
+
+class Segment:
+    """One recorded segment and its index, for seeking and reading frames back."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(_index_path(path), "rb") as f:
+            raw = f.read()
+        # A record cut short by a crash is ignored
+        count = len(raw) // INDEX_RECORD.size
+        records = [INDEX_RECORD.unpack_from(raw, i * INDEX_RECORD.size) for i in range(count)]
+        self.times = [r[0] for r in records]
+        self.offsets = [(r[1], r[2]) for r in records]
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def start(self):
+        return self.times[0] if self.times else None
+
+    @property
+    def end(self):
+        return self.times[-1] if self.times else None
+
+    def seek(self, timestamp):
+        """Index of the first frame at or after `timestamp`."""
+        return bisect.bisect_left(self.times, timestamp)
+
+    def frames(self, start=None, end=None):
+        """Yield (timestamp, jpeg bytes) between the two times (inclusive)."""
+        first = self.seek(start) if start is not None else 0
+        with open(self.path, "rb") as f:
+            for i in range(first, len(self.times)):
+                if end is not None and self.times[i] > end:
+                    break
+                offset, length = self.offsets[i]
+                f.seek(offset)
+                yield self.times[i], f.read(length)
+
+
+def read_frames(directory, start=None, end=None, prefix="*"):
+    """Yield (timestamp, jpeg) for every recorded frame between `start` and `end`.
+
+    Segments come oldest first; with several cameras their frames follow
+    one segment after another, not interleaved by time.
+    """
+    for path in list_segments(directory, prefix):
+        segment = Segment(path)
+        if not len(segment) or (start is not None and segment.end < start):
+            continue
+        if end is not None and segment.start > end:
+            continue
+        yield from segment.frames(start, end)
+
+
+def parse_time(text, day=None):
+    """Epoch seconds from "HH:MM[:SS]" (on `day`, default today) or a full ISO date-time."""
+    try:
+        return datetime.datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        pass
+    clock = datetime.time.fromisoformat(text)
+    return datetime.datetime.combine(day or datetime.date.today(), clock).timestamp()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="List and extract recorded camera footage")
+    ap.add_argument("directory")
+    ap.add_argument("--prefix", default="*", help="Camera prefix of the segments")
+    ap.add_argument("--list", action="store_true", help="Show the segments and their time ranges")
+    ap.add_argument("--at", type=parse_time, help="Extract the frame at this time to --out")
+    ap.add_argument("--from", dest="start", type=parse_time, help="Start of the clip to extract")
+    ap.add_argument("--to", dest="end", type=parse_time, help="End of the clip to extract")
+    ap.add_argument("--out", help="Output .jpg (--at) or .mjpeg (--from/--to)")
+    args = ap.parse_args()
+
+    if args.list or not args.out:
+        for path in list_segments(args.directory, args.prefix):
+            segment = Segment(path)
+            if len(segment):
+                start = datetime.datetime.fromtimestamp(segment.start)
+                end = datetime.datetime.fromtimestamp(segment.end)
+                print(f"{os.path.basename(path)}  {start:%Y-%m-%d %H:%M:%S} - {end:%H:%M:%S}  "
+                      f"{len(segment)} frames  {_segment_bytes(path) / 2**20:.1f} MiB")
+        return
+    if args.at is not None:
+        for _, jpeg in read_frames(args.directory, args.at, prefix=args.prefix):
+            with open(args.out, "wb") as f:
+                f.write(jpeg)
+            print(f"Wrote {args.out}")
+            return
+        print("No frame at or after that time")
+        return
+    frames = read_frames(args.directory, args.start, args.end, args.prefix)
+    count = write_clip(args.out, (jpeg for _, jpeg in frames))
+    print(f"Wrote {count} frames to {args.out} (replay with: python fake_esp32.py {args.out})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Adaptive detection scheduler.
+
+Detection runs at a quality level picked from a ladder: input scale, how
+many frames to skip between detections and the Haar cascade parameters.
+The scheduler measures how long each detection + recognition pass takes
+and steps down the ladder when the processor cannot keep up with
+`target_fps`, or back up when there is headroom, so slow laptops lose
+resolution instead of lagging seconds behind the ESP32 stream.
+"""
+import collections
+import time
+from contextlib import contextmanager
+
+import cv2
+
+import metrics
+
+Level = collections.namedtuple("Level", "scale interval scale_factor min_neighbors")
+
+# Haar on full-resolution frames (app4.py / app5.py / cli-app.py)
+HAAR_LEVELS = [
+    Level(1.0, 1, 1.1, 5),
+    Level(0.75, 1, 1.1, 5),
+    Level(0.5, 1, 1.15, 4),
+    Level(0.5, 2, 1.2, 4),
+    Level(0.35, 2, 1.2, 3),
+    Level(0.35, 3, 1.3, 3),
+]
+
+# HOG via face_recognition.face_locations (app.py); cascade fields unused
+HOG_LEVELS = [
+    Level(0.5, 1, None, None),
+    Level(0.35, 1, None, None),
+    Level(0.25, 1, None, None),
+    Level(0.25, 2, None, None),
+    Level(0.2, 3, None, None),
+]
+
+
+class AdaptiveScheduler:
+    def __init__(self, levels=HAAR_LEVELS, target_fps=15, start_level=0, window=20,
+                 min_size=(30, 30)):
+        self.levels = levels
+        self.target_fps = target_fps
+        self.window = window
+        self.min_size = min_size
+        self.index = start_level
+        self._frame = 0
+        self._samples = []
+
+    @property
+    def level(self):
+        return self.levels[self.index]
+
+    @property
+    def scale(self):
+        return self.level.scale
+
+    def should_detect(self):
+        """Call once per frame; False on frames the current level skips."""
+        self._frame += 1
+        return self._frame % self.level.interval == 0
+
+    @contextmanager
+    def timed(self):
+        """Wrap the detection + recognition work of one frame."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - start)
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+        if len(self._samples) < self.window:
+            return
+        # Per-frame cost once the skipped frames are accounted for
+        cost = sorted(self._samples)[len(self._samples) // 2] / self.level.interval
+        budget = 1.0 / self.target_fps
+        self._samples = []
+        if cost > budget and self.index < len(self.levels) - 1:
+            self.index += 1
+        elif cost < 0.5 * budget and self.index > 0:
+            # Hysteresis: only step back up with plenty of headroom
+            self.index -= 1
+        else:
+            return
+        print(f"[scheduler] {cost * 1000:.1f} ms/frame vs {budget * 1000:.1f} ms budget, "
+              f"now {self.level}")
+
+    def gray_reduce(self):
+        """JPEG decode reduction (1, 2, 4 or 8) that still covers the current scale.
+
+        Pass as Pipeline(gray_reduce=scheduler.gray_reduce) so the decoder
+        does most of the downscaling detect_haar() would otherwise do.
+        """
+        reduce = 1
+        while reduce < 8 and self.level.scale * reduce * 2 <= 1.0:
+            reduce *= 2
+        return reduce
+
+    def detect_haar(self, cascade, gray, reduce=1):
+        """detectMultiScale at the current level; boxes in full-resolution coordinates.
+
+        `gray` may already be downscaled by `reduce` (see gray_reduce()).
+        """
+        level = self.level
+        # Scale of the detection image relative to the full-resolution frame
+        scale = min(level.scale, 1.0 / reduce)
+        if scale * reduce != 1.0:
+            gray = cv2.resize(gray, (0, 0), fx=scale * reduce, fy=scale * reduce,
+                              interpolation=cv2.INTER_AREA)
+        min_size = (max(int(self.min_size[0] * scale), 12),
+                    max(int(self.min_size[1] * scale), 12))
+        with metrics.stage("detect"):
+            faces = cascade.detectMultiScale(gray, scaleFactor=level.scale_factor,
+                                             minNeighbors=level.min_neighbors, minSize=min_size)
+        if scale == 1.0 or len(faces) == 0:
+            return faces
+        return (faces / scale).astype(int)
@@ -0,0 +1,207 @@
+"""Background serial transport for the robot's Bluetooth (HC-05) link.
+
+SerialLink owns the port: write() only appends to an outbox, and a writer
+thread sends everything that piled up since its last write in one
+ser.write().  When Bluetooth drops, the port is closed and reopened with
+exponential backoff; commands older than `max_age` are dropped rather than
+replayed late.  If the firmware answers each command with a line starting
+with `ack`, a reader thread matches the answers to the commands in order
+and records the round-trip latency.
+
+`port` is anything serial.serial_for_url() accepts: "COM7", "/dev/rfcomm0",
+a pseudo-terminal, or "loop://".  open_fake_robot() creates a pty with a
+fake robot on the other end, to exercise the link without hardware:
+
+    port, robot = open_fake_robot()
+    link = SerialLink(port, ack="OK").start()
+"""
+import collections
+import os
+import threading
+import time
+
+import serial
+
+import metrics
+
+
+class SerialLink:
+    def __init__(self, port="COM7", baudrate=9600, timeout=1, ack=None, max_age=2.0,
+                 backoff=(0.5, 8.0)):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.ack = ack.encode() if isinstance(ack, str) else ack
+        self.max_age = max_age
+        self.backoff = backoff
+        self._ser = None
+        self._cond = threading.Condition()
+        self._outbox = collections.deque()  # (data, t_queued)
+        self._unacked = collections.deque()  # t_written per command awaiting an ack
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="serial-writer", daemon=True)
+        # Stats
+        self.sent = 0
+        self.batches = 0
+        self.bytes_out = 0
+        self.expired = 0
+        self.reconnects = 0
+        self.acks = 0
+        self.ack_total = 0.0
+        self.ack_max = 0.0
+
+    @property
+    def connected(self):
+        return self._ser is not None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def write(self, data):
+        """Queue bytes (or a str) for the writer thread; never blocks."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        with self._cond:
+            self._outbox.append((data, time.monotonic()))
+            self._cond.notify()
+
+    def _connect(self):
+        delay = self.backoff[0]
+        while not self._closed:
+            try:
+                ser = serial.serial_for_url(self.port, baudrate=self.baudrate,
+                                            timeout=self.timeout, write_timeout=self.timeout)
+            except (serial.SerialException, OSError) as e:
+                print(f"Serial {self.port} unavailable ({e}), retrying in {delay:.1f} s")
+                with self._cond:
+                    self._cond.wait_for(lambda: self._closed, delay)
+                delay = min(delay * 2, self.backoff[1])
+                continue
+            print(f"Serial connection to {self.port} established.")
+            self._ser = ser
+            if self.ack is not None:
+                threading.Thread(target=self._read_acks, args=(ser,), name="serial-reader",
+                                 daemon=True).start()
+            return True
+        return False
+
+    def _disconnect(self, error):
+        print(f"Serial {self.port} lost: {error}")
+        ser, self._ser = self._ser, None
+        try:
+            ser.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._unacked.clear()
+        self.reconnects += 1
+
+    def _run(self):
+        while True:
+            if self._ser is None and not self._connect():
+                return
+            with self._cond:
+                self._cond.wait_for(lambda: self._outbox or self._closed)
+                if not self._outbox:
+                    break
+                now = time.monotonic()
+                batch = []
+                while self._outbox:
+                    data, t_queued = self._outbox.popleft()
+                    if now - t_queued > self.max_age:
+                        self.expired += 1
+                        continue
+                    batch.append((data, t_queued))
+            if not batch:
+                continue
+            try:
+                # Everything queued since the last write goes out in one call
+                with metrics.stage("serial_send"):
+                    self._ser.write(b"".join(data for data, _ in batch))
+                    self._ser.flush()
+            except (serial.SerialException, OSError) as e:
+                with self._cond:
+                    # Resend after reconnecting unless the commands expire first;
+                    # they keep their queue time so reconnects do not make them young
+                    self._outbox.extendleft(reversed(batch))
+                self._disconnect(e)
+                continue
+            t_written = time.monotonic()
+            with self._cond:
+                self._unacked.extend([t_written] * len(batch))
+            self.sent += len(batch)
+            self.batches += 1
+            self.bytes_out += sum(len(data) for data, _ in batch)
+        if self._ser is not None:
+            self._ser.close()
+            self._ser = None
+
+    def _read_acks(self, ser):
+        while self._ser is ser:
+            try:
+                line = ser.readline()
+            except (serial.SerialException, OSError, TypeError):
+                return  # The writer notices on its next write
+            if not line.startswith(self.ack):
+                continue
+            now = time.monotonic()
+            with self._cond:
+                if not self._unacked:
+                    continue
+                latency = now - self._unacked.popleft()
+            self.acks += 1
+            self.ack_total += latency
+            self.ack_max = max(self.ack_max, latency)
+
+    def stats(self):
+        return {"connected": self.connected, "sent": self.sent, "batches": self.batches,
+                "bytes": self.bytes_out, "expired": self.expired,
+                "reconnects": self.reconnects, "acks": self.acks,
+                "ack_avg_ms": self.ack_total / self.acks * 1000 if self.acks else None,
+                "ack_max_ms": self.ack_max * 1000 if self.acks else None}
+
+    def close(self, timeout=1.0):
+        """Send what is still queued (within `timeout`) and close the port."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+
+def open_fake_robot(ack="OK", delay=0.0):
+    """Open a pty whose far end answers each command line with `ack` (POSIX only).
+
+    Returns (port_name, thread); the received commands are collected in
+    thread.commands.  Pass `delay` seconds to simulate a slow robot.
+    """
+    import pty
+    import tty
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    port = os.ttyname(slave)
+
+    def run():
+        buf = b""
+        while True:
+            try:
+                data = os.read(master, 1024)
+            except OSError:
+                return
+            if not data:
+                return
+            buf += data
+            while b"\n" in buf:
+                line, buf = buf.split(b"\n", 1)
+                thread.commands.append(line.decode(errors="replace"))
+                if delay:
+                    time.sleep(delay)
+                if ack is not None:
+                    os.write(master, ack.encode() + b"\n")
+
+    thread = threading.Thread(target=run, name="fake-robot", daemon=True)
+    thread.commands = []
+    thread.start()
+    return port, thread
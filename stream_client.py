@@ -0,0 +1,224 @@
+"""MJPEG client that survives camera reboots and WiFi drops.
+
+A bare requests.get(stream_url, stream=True) blocks forever when the
+ESP32 vanishes mid-frame and ends silently when it closes the socket.
+MjpegClient.frames() instead yields JPEG frames until close() is called:
+
+* connect and read timeouts turn a dead link into an error instead of a hang;
+* after an error the stream is reopened with exponential backoff;
+* a stream that keeps delivering bytes but no frame for `stall_timeout`
+  seconds is treated as dead too;
+* after `fallback_after` failed attempts in a row it polls the firmware's
+  single-shot /jpg endpoint instead, and tries the stream again every
+  `retry_stream_every` seconds.
+
+One requests.Session is reused for every request, so reconnects and /jpg
+polls skip the DNS lookup and reuse a connection where the server allows.
+
+`python stream_client.py` takes a client through all of this against a
+local fake camera (fake_esp32.py).
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+import metrics
+from mjpeg_parser import MjpegParser
+
+
+def jpg_url_for(stream_url):
+    """The firmware's single-shot endpoint on the same host as `stream_url`."""
+    parts = urlsplit(stream_url)
+    return urlunsplit((parts.scheme, parts.netloc, "/jpg", "", ""))
+
+
+class StreamStalled(Exception):
+    pass
+
+
+class MjpegClient:
+    """Reads one camera's MJPEG stream for as long as the app runs.
+
+        client = MjpegClient(url, fallback_url=jpg_url_for(url))
+        pipeline = Pipeline(client.frames, ...)
+
+    Reconnects with backoff when the camera reboots or WiFi drops and, with
+    `fallback_url`, polls the single-shot /jpg endpoint while the stream
+    stays down.
+    """
+
+    def __init__(self, url, connect_timeout=3.0, read_timeout=5.0, stall_timeout=3.0,
+                 backoff=(0.5, 10.0), fallback_url=None, fallback_after=3,
+                 retry_stream_every=30.0, poll_interval=0.1, chunk_size=4096):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.stall_timeout = stall_timeout
+        self.backoff = backoff
+        self.fallback_url = fallback_url
+        self.fallback_after = fallback_after
+        self.retry_stream_every = retry_stream_every
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        self._closed = threading.Event()
+        self._response = None
+        self.mode = "stream"
+        # Stats
+        self.connects = 0
+        self.errors = 0
+        self.stalls = 0
+        self.received = 0
+        self.polled = 0
+        self.last_error = None
+
+    def frames(self):
+        """Yield JPEG frames, reconnecting as needed, until close()."""
+        failures = 0
+        delay = self.backoff[0]
+        while not self._closed.is_set():
+            got_frame = False
+            try:
+                for frame in self._stream():
+                    got_frame = True
+                    failures = 0
+                    delay = self.backoff[0]
+                    yield frame
+                # The camera closed the connection cleanly
+                raise requests.ConnectionError("stream ended")
+            except (requests.RequestException, StreamStalled) as e:
+                if self._closed.is_set():
+                    break
+                self.errors += 1
+                self.last_error = e
+                failures = 0 if got_frame else failures + 1
+                print(f"MJPEG stream {self.url}: {e}")
+            if self.fallback_url and failures >= self.fallback_after:
+                yield from self._poll_jpg()
+                failures = 0
+                continue
+            print(f"Reconnecting in {delay:.1f} s")
+            if self._closed.wait(delay):
+                break
+            delay = min(delay * 2, self.backoff[1])
+
+    def _stream(self):
+        self.mode = "stream"
+        response = self.session.get(self.url, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+        self._response = response
+        self.connects += 1
+        parser = MjpegParser()
+        read_time = metrics.stage_histogram("read")
+        last_frame = time.monotonic()
+        t_read = time.perf_counter()
+        try:
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if self._closed.is_set():
+                    return
+                frames = parser.feed(chunk)
+                now = time.monotonic()
+                if frames:
+                    last_frame = now
+                elif now - last_frame > self.stall_timeout:
+                    self.stalls += 1
+                    raise StreamStalled(f"no frame for {now - last_frame:.1f} s")
+                for frame in frames:
+                    self.received += 1
+                    # Time spent waiting for and parsing this frame's bytes
+                    read_time.observe(time.perf_counter() - t_read)
+                    yield frame
+                    t_read = time.perf_counter()
+        finally:
+            response.close()
+            self._response = None
+
+    def _poll_jpg(self):
+        """Poll /jpg until the stream is due for another try."""
+        self.mode = "poll"
+        print(f"Falling back to polling {self.fallback_url}")
+        until = time.monotonic() + self.retry_stream_every
+        read_time = metrics.stage_histogram("read")
+        delay = self.backoff[0]
+        while not self._closed.is_set() and time.monotonic() < until:
+            start = time.monotonic()
+            try:
+                response = self.session.get(self.fallback_url, timeout=self.timeout)
+                response.raise_for_status()
+                frame = response.content
+            except requests.RequestException as e:
+                self.errors += 1
+                self.last_error = e
+                if self._closed.wait(delay):
+                    return
+                delay = min(delay * 2, self.backoff[1])
+                continue
+            delay = self.backoff[0]
+            read_time.observe(time.monotonic() - start)
+            if frame:
+                self.polled += 1
+                self.received += 1
+                yield frame
+            self._closed.wait(max(self.poll_interval - (time.monotonic() - start), 0))
+
+    def close(self):
+        """Stop frames() from another thread, interrupting a blocked read."""
+        self._closed.set()
+        response = self._response
+        if response is not None:
+            response.close()
+        self.session.close()
+
+    def stats(self):
+        return {"mode": self.mode, "connects": self.connects, "errors": self.errors,
+                "stalls": self.stalls, "frames": self.received, "polled": self.polled}
+
+
+def check(frames=None, timeout=10.0):
+    """Take MjpegClient through a drop, a stall, the /jpg fallback and back.
+
+    `frames` defaults to the JPEGs in images/.  Raises AssertionError when a
+    step does not happen within `timeout` s.
+    """
+    # Only the check needs the fake camera (and OpenCV, to load its frames)
+    from fake_esp32 import FlakyCamera, load_frames
+    if frames is None:
+        frames = load_frames([os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")])
+    camera = FlakyCamera(frames, fps=20).start()
+    client = MjpegClient(camera.url, read_timeout=1.0, stall_timeout=0.5, backoff=(0.05, 0.2),
+                         fallback_url=camera.jpg_url, fallback_after=2,
+                         retry_stream_every=1.0, poll_interval=0.05)
+    reader = threading.Thread(target=lambda: [None for _ in client.frames()], daemon=True)
+    reader.start()
+
+    def wait_for(step, condition):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise AssertionError(f"MjpegClient: no {step} within {timeout} s: {client.stats()}")
+            time.sleep(0.02)
+        print(f"{step:14s} {client.stats()}")
+
+    streamed = lambda: client.received - client.polled
+    try:
+        wait_for("streaming", lambda: streamed() >= 5)
+        camera.fault = "drop"
+        before = streamed()
+        wait_for("reconnect", lambda: client.connects >= 2 and streamed() >= before + 5)
+        camera.fault = "stall"
+        wait_for("stall", lambda: client.stalls >= 1)
+        wait_for("/jpg fallback", lambda: client.mode == "poll" and client.polled >= 3)
+        camera.fault = None
+        before = streamed()
+        wait_for("recovery", lambda: client.mode == "stream" and streamed() >= before + 5)
+    finally:
+        client.close()
+        camera.stop()
+        reader.join(2)
+    print("MjpegClient: OK")
+
+
+if __name__ == "__main__":
+    check()
@@ -0,0 +1,110 @@
+"""Event-driven keyboard teleoperation.
+
+TeleopController is fed key down/up events (from keyboard.hook(), see
+run_keyboard_teleop()) and only sends a command when the resulting drive
+command changes: pressing an arrow sends it once, releasing every arrow
+sends "Stop".  OS key repeat does not resend anything.  While a command is
+active it is repeated every `heartbeat` seconds as a keepalive, so the
+robot can stop on its own if the link goes quiet.  Through a
+CommandDispatcher the heartbeat must be at least its `debounce`, or every
+keepalive is dropped as a repeat.  Between events nothing
+runs, so an idle teleop session uses no CPU.
+"""
+import threading
+import time
+
+DEFAULT_KEYS = {
+    "up": "Forward",
+    "down": "Backward",
+    "left": "Left",
+    "right": "Right",
+}
+
+
+class TeleopController:
+    def __init__(self, send, key_map=None, stop="Stop", heartbeat=0.5):
+        self.send = send
+        self.key_map = DEFAULT_KEYS if key_map is None else key_map
+        self.stop = stop
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._pressed = []  # Movement keys held down, most recent last
+        self._command = None
+        self._done = threading.Event()
+        # Stats
+        self.started = time.monotonic()
+        self.events = 0
+        self.changes = 0
+        self.keepalives = 0
+
+    @property
+    def command(self):
+        return self._command
+
+    def on_key(self, name, down):
+        """Feed one key event; returns the command sent, if any."""
+        if name not in self.key_map:
+            return None
+        with self._lock:
+            self.events += 1
+            if down and name not in self._pressed:
+                self._pressed.append(name)
+            elif not down and name in self._pressed:
+                self._pressed.remove(name)
+            # The most recently pressed key that is still held wins
+            command = self.key_map[self._pressed[-1]] if self._pressed else self.stop
+            if command == self._command:
+                return None
+            self._command = command
+            self.changes += 1
+        self.send(command)
+        return command
+
+    def run_heartbeat(self):
+        """Repeat the active command every `heartbeat` seconds until stop_heartbeat()."""
+        while not self._done.wait(self.heartbeat):
+            command = self._command
+            if command is not None and command != self.stop:
+                self.keepalives += 1
+                self.send(command)
+
+    def stop_heartbeat(self):
+        self._done.set()
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        sent = self.changes + self.keepalives
+        return {"events": self.events, "changes": self.changes, "keepalives": self.keepalives,
+                "commands_per_s": sent / elapsed if elapsed > 0 else 0.0}
+
+
+def run_keyboard_teleop(send, quit_key="q", **kwargs):
+    """Drive the robot from the arrow keys until `quit_key` is pressed."""
+    import keyboard
+
+    controller = TeleopController(send, **kwargs)
+    quit_event = threading.Event()
+
+    def on_event(event):
+        if event.name == quit_key:
+            quit_event.set()
+        else:
+            controller.on_key(event.name, event.event_type == keyboard.KEY_DOWN)
+
+    heartbeat = threading.Thread(target=controller.run_heartbeat, name="teleop-heartbeat",
+                                 daemon=True)
+    heartbeat.start()
+    cpu_start = time.process_time()
+    hook = keyboard.hook(on_event)
+    try:
+        quit_event.wait()
+    finally:
+        keyboard.unhook(hook)
+        controller.stop_heartbeat()
+        heartbeat.join()
+        # Never leave the robot driving after quitting
+        if controller.command not in (None, controller.stop):
+            send(controller.stop)
+    stats = controller.stats()
+    stats["cpu_s"] = time.process_time() - cpu_start
+    return stats
@@ -0,0 +1,61 @@
+"""Lightweight per-stage wall-clock timers for the video loops."""
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+import tracing
+
+
+class StageTimer:
+    """Accumulate count / total / max time per named stage.
+
+        with timer.stage("detect"):
+            face_locations = face_recognition.face_locations(rgb)
+
+    frame_done() prints the averages every `every` frames and resets them.
+    With `export` every measurement also goes to the metrics stage histogram
+    of the same name and, from stage(), to the frame trace.
+    """
+
+    def __init__(self, every=100, export=True):
+        self.every = every
+        self.export = export
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._frames = 0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.record(name, end - start)
+            if self.export:
+                tracing.TRACER.span(name, start, end)
+
+    def record(self, name, seconds):
+        if self.export:
+            metrics.stage_histogram(name).observe(seconds)
+        with self._lock:
+            count, total, worst = self._stats.get(name, (0, 0.0, 0.0))
+            self._stats[name] = (count + 1, total + seconds, max(worst, seconds))
+
+    def summary(self):
+        with self._lock:
+            return {name: {"count": count, "avg_ms": total / count * 1000, "max_ms": worst * 1000}
+                    for name, (count, total, worst) in self._stats.items()}
+
+    def format(self):
+        return "  ".join(f"{name} {s['avg_ms']:.1f}ms (max {s['max_ms']:.1f})"
+                         for name, s in self.summary().items())
+
+    def frame_done(self):
+        """Call once per frame; prints and resets the stats every `every` frames."""
+        self._frames += 1
+        if self.every and self._frames % self.every == 0:
+            print(f"[timing] {self._frames} frames: {self.format()}")
+            with self._lock:
+                self._stats.clear()
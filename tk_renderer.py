@@ -0,0 +1,194 @@
+"""Display processed frames from the Tk main loop.
+
+Tkinter widgets must only be touched from the thread running mainloop().
+The pipeline's render stage calls submit(), which prepares the display
+image on the pipeline thread and drops it into a single shared slot.  A
+root.after() timer on the main loop picks up whatever is newest, pastes it
+into one long-lived PhotoImage and does nothing when no new frame arrived.
+
+The decoded frame itself is never drawn on: submit() resizes it (or a
+reduced-size decode, see FramePacket.preview) into a preallocated buffer,
+draws packet.faces there at display scale and converts straight into a
+pooled RGBA buffer that PIL wraps without copying.
+
+StatsOverlay shows the live fps, stage times and dropped frames on top,
+and TkTextSlot hands label text from other threads to the main loop the
+same way submit() hands over frames.  start_diagnostics() is the one call
+the GUI apps make for the overlay, the /metrics endpoint and trace dumps.
+"""
+import threading
+import tkinter as tk
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+import metrics
+import tracing
+from frame_buffers import BufferPool
+
+
+def draw_faces(image, faces, sx, sy, style="caption"):
+    """Draw (top, right, bottom, left, name) boxes given in source-frame coordinates.
+
+    style "caption" writes the name above the box (Haar apps), "banner" in a
+    filled bar along its bottom edge (face_recognition apps).
+    """
+    for (top, right, bottom, left, name) in faces:
+        top, bottom = int(top * sy), int(bottom * sy)
+        left, right = int(left * sx), int(right * sx)
+        cv2.rectangle(image, (left, top), (right, bottom), (0, 255, 0), 2)
+        if name is None:
+            continue
+        if style == "banner":
+            cv2.rectangle(image, (left, bottom - 35), (right, bottom), (0, 255, 0), cv2.FILLED)
+            cv2.putText(image, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        else:
+            cv2.putText(image, name, (left, top-10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (255,255,255), 2)
+
+
+class TkVideoRenderer:
+    def __init__(self, root, label, size=(640, 480), interval_ms=15, style="caption"):
+        self.root = root
+        self.label = label
+        self.size = size
+        self.interval_ms = interval_ms
+        self.style = style
+        self._lock = threading.Lock()
+        self._slot = None
+        self._photo = None
+        self._after_id = None
+        width, height = size
+        # Only touched by the render stage thread
+        self._resized = np.empty((height, width, 3), dtype=np.uint8)
+        # Shared with the main loop: submit() fills one, _tick() hands it back
+        self.buffers = BufferPool((height, width, 4))
+        self._stale = metrics.stale("display")
+        self._latency = metrics.latency()
+        # Stats
+        self.submitted = 0
+        self.shown = 0
+
+    def submit(self, packet):
+        """Pipeline render stage: resize, annotate and convert off the main loop."""
+        # A reduced decode is enough when nothing needed the full frame
+        src = packet.preview(self.size)
+        cv2.resize(src, self.size, dst=self._resized)
+        if packet.faces:
+            width, height = packet.frame_size()
+            draw_faces(self._resized, packet.faces, self.size[0] / width,
+                       self.size[1] / height, self.style)
+        rgba = self.buffers.acquire()
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGBA, dst=rgba)
+        with self._lock:
+            old, self._slot = self._slot, rgba
+            self.submitted += 1
+        if old is not None:
+            self.buffers.release(old)  # Superseded before it was shown
+            self._stale.inc()
+        self._latency.observe(tracing.now() - packet.t_arrival)
+        return packet
+
+    def start(self):
+        self._after_id = self.root.after(self.interval_ms, self._tick)
+        return self
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def stats(self):
+        return dict(self.buffers.stats(), submitted=self.submitted, shown=self.shown)
+
+    def _tick(self):
+        self._after_id = self.root.after(self.interval_ms, self._tick)
+        with self._lock:
+            frame, self._slot = self._slot, None
+        if frame is None:
+            return  # Nothing new since the last redraw
+        # RGBA lets PIL wrap the buffer instead of copying it
+        img = Image.frombuffer("RGBA", self.size, frame, "raw", "RGBA", 0, 1)
+        if self._photo is None:
+            self._photo = ImageTk.PhotoImage(image=img)
+            self.label.configure(image=self._photo)
+        else:
+            self._photo.paste(img)
+        del img
+        self.buffers.release(frame)
+        self.shown += 1
+
+
+class StatsOverlay:
+    """A one-line metrics summary (see metrics.RateTracker) over the top-left of `parent`.
+
+    Give it the video label to keep the figures on the picture.
+    """
+
+    def __init__(self, parent, interval_ms=1000, registry=metrics.REGISTRY):
+        self.parent = parent
+        self.interval_ms = interval_ms
+        self.tracker = metrics.RateTracker(registry)
+        self.label = tk.Label(parent, font=("Courier", 9), fg="#00ff00", bg="black", anchor="w")
+        self._after_id = None
+
+    def start(self):
+        self.label.place(x=0, y=0)
+        self._after_id = self.parent.after(self.interval_ms, self._tick)
+        return self
+
+    def stop(self):
+        if self._after_id is not None:
+            self.parent.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _tick(self):
+        self._after_id = self.parent.after(self.interval_ms, self._tick)
+        self.label.configure(text=self.tracker.format())
+
+
+def start_diagnostics(root, video_label, metrics_port=9108):
+    """Overlay, metrics endpoint and trace hotkey for a Tk app; returns the StatsOverlay.
+
+    The overlay sits on `video_label`.  The full histograms are served at
+    http://127.0.0.1:`metrics_port`/metrics for Prometheus (0 disables it;
+    a port already in use only prints a warning).  F12 writes a Chrome /
+    Perfetto trace (chrome://tracing, ui.perfetto.dev) of the last frames'
+    stages.
+    """
+    overlay = StatsOverlay(video_label).start()
+    if metrics_port:
+        metrics.serve(metrics_port)
+    root.bind("<F12>", lambda event: tracing.dump())
+    return overlay
+
+
+class TkTextSlot:
+    """Text for `label` that any thread may set(); the main loop shows the newest."""
+
+    def __init__(self, label, interval_ms=100):
+        self.label = label
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._text = None
+        self._after_id = None
+
+    def set(self, text):
+        with self._lock:
+            self._text = text
+
+    def start(self):
+        self._after_id = self.label.after(self.interval_ms, self._tick)
+        return self
+
+    def stop(self):
+        if self._after_id is not None:
+            self.label.after_cancel(self._after_id)
+            self._after_id = None
+
+    def _tick(self):
+        self._after_id = self.label.after(self.interval_ms, self._tick)
+        with self._lock:
+            text, self._text = self._text, None
+        if text is not None:
+            self.label.configure(text=text)
@@ -0,0 +1,153 @@
+"""Per-frame spans, exportable as a Chrome / Perfetto trace.
+
+Every FramePacket carries its sequence number and arrival time (when the
+reader got the complete JPEG).  Pipeline stages run with the packet as the
+thread's current frame, so each span recorded while handling it -- the
+pipeline stages themselves and everything timed with metrics.stage(), e.g.
+detect, embed, match -- is tagged with the frame's stream and seq:
+
+    with tracing.TRACER.frame(packet):
+        with metrics.stage("detect"):
+            ...
+    tracing.mark("open", packet)   # e.g. when send_command("Open") fires
+
+mark() also records the latency from the frame's arrival.  dump() writes
+the most recent spans (a bounded ring, so tracing can stay on) as trace
+JSON for chrome://tracing or ui.perfetto.dev; summary() breaks the marked
+latencies down by stage.
+"""
+import collections
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+now = time.perf_counter  # Clock of FramePacket.t_arrival and every span
+
+
+def frame_args(packet):
+    if packet is None:
+        return {}
+    return {"stream": packet.stream, "seq": packet.seq}
+
+
+class Tracer:
+    def __init__(self, capacity=50000):
+        self.enabled = True
+        self._events = collections.deque(maxlen=capacity)  # (name, start, dur, tid, args)
+        self._marks = collections.deque(maxlen=1000)  # (name, args, latency)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tids = {}
+
+    def _tid(self, thread=None):
+        name = thread or threading.current_thread().name
+        tid = self._tids.get(name)
+        if tid is None:
+            with self._lock:
+                tid = self._tids.setdefault(name, len(self._tids) + 1)
+        return tid
+
+    @contextmanager
+    def frame(self, packet):
+        """Make `packet` the current frame of this thread."""
+        previous = getattr(self._local, "packet", None)
+        self._local.packet = packet
+        try:
+            yield packet
+        finally:
+            self._local.packet = previous
+
+    def current(self):
+        return getattr(self._local, "packet", None)
+
+    def span(self, name, start, end, args=None, thread=None):
+        """Record `name` from `start` to `end` (now() values).
+
+        `args` defaults to the current frame; `thread` names the track when
+        the work did not run on this thread (e.g. a worker process).
+        """
+        if not self.enabled:
+            return
+        if args is None:
+            args = frame_args(self.current())
+        self._events.append((name, start, end - start, self._tid(thread), args))
+
+    def mark(self, name, packet=None):
+        """Instant event for `packet` (default: current frame); records its age."""
+        if not self.enabled:
+            return
+        packet = packet if packet is not None else self.current()
+        t = now()
+        args = frame_args(packet)
+        self._events.append((name, t, None, self._tid(), args))
+        if packet is not None:
+            self._marks.append((name, args, t - packet.t_arrival))
+
+    def chrome_trace(self):
+        events = list(self._events)
+        origin = min((e[1] for e in events), default=0.0)
+        trace = [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                 for name, tid in list(self._tids.items())]
+        for name, start, dur, tid, args in events:
+            event = {"name": name, "cat": "frame", "pid": 1, "tid": tid,
+                     "ts": (start - origin) * 1e6, "args": args}
+            if dur is None:
+                event.update(ph="i", s="t")
+            else:
+                event.update(ph="X", dur=dur * 1e6)
+            trace.append(event)
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def dump(self, path=None):
+        """Write the trace JSON; returns the path."""
+        path = path or time.strftime("trace-%Y%m%d-%H%M%S.json")
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+    def summary(self, name="open"):
+        """Arrival-to-`name` latency of the marked frames and their time per stage, in ms.
+
+        "read" is the wait for the frame's bytes before it arrived; nested
+        spans (detect inside process) are counted in both.
+        """
+        marks = [(args, latency) for mark, args, latency in list(self._marks) if mark == name]
+        if not marks:
+            return {"count": 0}
+        latencies = sorted(latency * 1000 for _, latency in marks)
+        keys = {(args.get("stream"), args.get("seq")) for args, _ in marks}
+        stages = collections.defaultdict(float)
+        for span, _, dur, _, args in list(self._events):
+            if dur is not None and (args.get("stream"), args.get("seq")) in keys:
+                stages[span] += dur * 1000
+        return {"count": len(latencies),
+                "avg_ms": sum(latencies) / len(latencies),
+                "p50_ms": latencies[len(latencies) // 2],
+                "p95_ms": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+                "max_ms": latencies[-1],
+                "stages_avg_ms": {stage: total / len(keys) for stage, total in stages.items()}}
+
+    def format(self, name="open"):
+        s = self.summary(name)
+        if not s["count"]:
+            return f"no '{name}' events"
+        stages = "  ".join(f"{stage} {ms:.1f}" for stage, ms in
+                           sorted(s["stages_avg_ms"].items(), key=lambda kv: -kv[1]))
+        return (f"{s['count']} '{name}': arrival -> {name} avg {s['avg_ms']:.0f}ms "
+                f"p50 {s['p50_ms']:.0f} p95 {s['p95_ms']:.0f} max {s['max_ms']:.0f}  "
+                f"per frame: {stages}")
+
+
+TRACER = Tracer()
+
+
+def mark(name, packet=None):
+    TRACER.mark(name, packet)
+
+
+def dump(path=None):
+    """Write the trace and print the arrival-to-Open summary; returns the path."""
+    path = TRACER.dump(path)
+    print(f"[trace] wrote {path}; {TRACER.format()}")
+    return path
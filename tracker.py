@@ -0,0 +1,106 @@
+"""IoU tracker that carries face identities across frames.
+
+Haar/HOG detection is cheap compared to face_encodings(), and a person
+standing in front of the robot produces nearly the same box frame after
+frame.  FaceTracker links each new detection to the track it overlaps most,
+so a face only has to be embedded when its track is new or its identity is
+older than `reembed_every` detections.  Ages count update() calls, i.e.
+detection passes: frames the scheduler or the motion gate skip do not age
+a track, so with skipping that is more than `reembed_every` frames.
+
+A cached identity is only as good as the IoU match: someone stepping into
+the box another person just left inherits their name.  Callers that act on
+a name (the robot's "Open") pass stale() a `verify` check so those tracks
+are embedded again first.
+"""
+import itertools
+
+
+def iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    inter = (bottom - top) * (right - left)
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+class Track:
+    __slots__ = ("id", "box", "name", "detections_since_embed", "misses")
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = tuple(box)
+        self.name = None
+        self.detections_since_embed = None  # None until the first embedding
+        self.misses = 0
+
+    def set_identity(self, name):
+        self.name = name
+        self.detections_since_embed = 0
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, reembed_every=15, max_misses=5):
+        self.iou_threshold = iou_threshold
+        self.reembed_every = reembed_every
+        self.max_misses = max_misses
+        self.tracks = []
+        self._ids = itertools.count(1)
+        # Stats
+        self.embedded = 0
+        self.reused = 0
+
+    def update(self, locations):
+        """Match this frame's boxes to tracks; returns one Track per box, in order."""
+        pairs = sorted(((iou(t.box, box), ti, bi)
+                        for ti, t in enumerate(self.tracks)
+                        for bi, box in enumerate(locations)), reverse=True)
+        matched = [None] * len(locations)
+        used = set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in used or matched[bi] is not None:
+                continue
+            used.add(ti)
+            matched[bi] = self.tracks[ti]
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti in used:
+                track.misses = 0
+                survivors.append(track)
+            else:
+                track.misses += 1
+                if track.misses <= self.max_misses:
+                    survivors.append(track)
+        for bi, box in enumerate(locations):
+            if matched[bi] is None:
+                matched[bi] = Track(next(self._ids), box)
+                survivors.append(matched[bi])
+            else:
+                matched[bi].box = tuple(box)
+                if matched[bi].detections_since_embed is not None:
+                    matched[bi].detections_since_embed += 1
+        self.tracks = survivors
+        return matched
+
+    def needs_embedding(self, track):
+        return (track.detections_since_embed is None or
+                track.detections_since_embed >= self.reembed_every)
+
+    def stale(self, tracks, verify=None):
+        """The subset of `tracks` whose identity must be (re)computed.
+
+        With `verify`, tracks whose cached name it returns True for are
+        included too, however recent their embedding.
+        """
+        stale = [t for t in tracks if self.needs_embedding(t) or
+                 (verify is not None and t.name is not None and verify(t.name))]
+        self.embedded += len(stale)
+        self.reused += len(tracks) - len(stale)
+        return stale
@@ -1,45 +1,30 @@
 import cv2
 import tkinter as tk
 from tkinter import ttk, Label, Frame
-from PIL import Image, ImageTk
-import threading
-import time
 from ttkthemes import ThemedTk
 import face_recognition
-import numpy as np
-import os
+from face_index import KnownFaceIndex
+from encoding_cache import load_known_faces
+from pipeline import Pipeline, capture_frames
+from tk_renderer import TkVideoRenderer, start_diagnostics
+from recognition import largest_faces
+from timing import StageTimer
+from motion import MotionGate
 
 # --- Face Recognition Setup ---
 # Update the file path to your face images directory.
 face_images_path = r"C:\Users\arsha\OneDrive\Desktop\new-bot\images"
-images = []
-classnames = []
-mylist = os.listdir(face_images_path)
-print("Image list:", mylist)
-
-for cl in mylist:
-    img_path = os.path.join(face_images_path, cl)
-    crimg = cv2.imread(img_path)
-    if crimg is None:
-        continue
-    images.append(crimg)
-    classnames.append(os.path.splitext(cl)[0])
-
+classnames, encodings = load_known_faces(face_images_path)
+known_faces = KnownFaceIndex(classnames, encodings)
 print("Class names:", classnames)
 
-def find_encodings(images):
-    encodelist = []
-    for img in images:
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        try:
-            encode = face_recognition.face_encodings(img_rgb)[0]
-        except IndexError:
-            continue  # Skip images with no detectable face
-        encodelist.append(encode)
-    return encodelist
-
-encodelist_known = find_encodings(images)
-print("Encoding complete...")
+# Encode at most this many faces per frame (largest first); None encodes all.
+MAX_FACES_TO_ENCODE = None
+# Prints average detect / embed / match times every 100 frames (also exported to metrics).
+timer = StageTimer(every=100)
+motion = MotionGate()
+last_faces = []  # Results of the last detection, reused while the scene is static
+faces_present = False  # Any face in the last detection, known or not
 
 # --- End Face Recognition Setup ---
 
@@ -102,51 +87,47 @@ status_label.pack(side=tk.BOTTOM, fill=tk.X)
 # For simulation, use the laptop's webcam (0) as the video stream.
 cap = cv2.VideoCapture(0)
 
-def update_video():
-    while True:
-        ret, frame = cap.read()
-        if ret:
-            # --- Face Recognition Processing ---
-            # Resize frame to 1/4 size for faster processing
-            small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
-            small_frame_rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+def process_frame(packet):
+    global last_faces, faces_present
+    frame = packet.image
+
+    # --- Face Recognition Processing ---
+    if motion.update(frame) or faces_present:
+        # Resize frame to 1/4 size for faster processing
+        small_frame = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
+        small_frame_rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+        # Detect once and feed the same boxes to the encoder and the drawing code
+        with timer.stage("detect"):
             face_locations = face_recognition.face_locations(small_frame_rgb)
-            face_encodings = face_recognition.face_encodings(small_frame_rgb)
-            
-            for face_encoding, face_location in zip(face_encodings, face_locations):
-                matches = face_recognition.compare_faces(encodelist_known, face_encoding)
-                face_distances = face_recognition.face_distance(encodelist_known, face_encoding)
-                if len(face_distances) > 0:
-                    match_index = np.argmin(face_distances)
-                    if matches[match_index]:
-                        name = classnames[match_index].upper()
-                        # Scale face location back to original frame size
-                        top, right, bottom, left = face_location
-                        top *= 4
-                        right *= 4
-                        bottom *= 4
-                        left *= 4
-                        # Draw rectangle and label on the original frame
-                        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                        cv2.rectangle(frame, (left, bottom - 35), (right, bottom), (0, 255, 0), cv2.FILLED)
-                        cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-            # --- End Face Recognition Processing ---
-            
-            # Resize frame for display and convert color for Tkinter
-            display_frame = cv2.resize(frame, (640, 480))
-            display_frame_rgb = cv2.cvtColor(display_frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(display_frame_rgb)
-            imgtk = ImageTk.PhotoImage(image=img)
-            video_label.imgtk = imgtk  # Prevent garbage collection
-            video_label.configure(image=imgtk)
-        time.sleep(0.03)
-
-# Start the video stream in a separate thread to keep the GUI responsive.
-video_thread = threading.Thread(target=update_video, daemon=True)
-video_thread.start()
+        faces_present = len(face_locations) > 0
+        face_locations = largest_faces(face_locations, MAX_FACES_TO_ENCODE)
+        with timer.stage("embed"):
+            face_encodings = face_recognition.face_encodings(small_frame_rgb, face_locations)
+
+        # Match every face in the frame against the known faces in one go
+        with timer.stage("match"):
+            names, _ = known_faces.match(face_encodings)
+        # Scale face locations back to original frame size
+        last_faces = [tuple(v * 4 for v in face_location) + (name.upper(),)
+                      for name, face_location in zip(names, face_locations)
+                      if name is not None]
+    packet.faces.extend(last_faces)
+    # --- End Face Recognition Processing ---
+    timer.frame_done()
+    return packet
+
+renderer = TkVideoRenderer(root, video_label, style="banner").start()
+
+METRICS_PORT = 9108  # Prometheus /metrics, 0 = off
+overlay = start_diagnostics(root, video_label, METRICS_PORT)  # F12 dumps a trace
+
+pipeline = Pipeline(lambda: capture_frames(cap), process=process_frame, render=renderer.submit).start()
 
 # Ensure proper release of the webcam on exit.
 def on_closing():
+    pipeline.stop()
+    renderer.stop()
+    overlay.stop()
     cap.release()
     root.destroy()
 
@@ -0,0 +1,169 @@
+"""Process pool that runs face_recognition.face_encodings() on every CPU core.
+
+dlib's embedding is CPU-bound; separate processes put every core on it
+without depending on whether dlib releases the GIL while it runs.
+RecognitionPool copies the (padded) face crops of a frame into a slot of one
+shared-memory block and only sends the slot offset and crop shapes to a
+worker process; full frames are never pickled.  Results are kept per frame
+sequence number so the caller can collect them in frame order.  Several
+streams can share one pool by using (stream, seq) tuples as keys.
+
+On Windows worker processes are spawned, which re-imports the main script:
+only create a pool from scripts whose setup code is safe to run again.
+"""
+import multiprocessing as mp
+import os
+import signal
+import threading
+from multiprocessing import shared_memory
+
+import cv2
+import face_recognition
+import numpy as np
+
+import metrics
+import tracing
+
+_shm = None
+
+
+def _init_worker(shm_name):
+    global _shm
+    # Ctrl-C reaches the whole process group: the parent shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _shm = shared_memory.SharedMemory(name=shm_name)
+
+
+def _encode_crops(base, crops):
+    encodings = []
+    for crop in crops:
+        if crop is None:
+            encodings.append(None)
+            continue
+        offset, shape, location = crop
+        bgr = np.ndarray(shape, dtype=np.uint8, buffer=_shm.buf, offset=base + offset)
+        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+        result = face_recognition.face_encodings(rgb, [location])
+        encodings.append(result[0] if result else None)
+    return encodings
+
+
+def _older(a, b):
+    """True if key `a` is an earlier frame of the same stream as key `b`."""
+    if isinstance(a, tuple) or isinstance(b, tuple):
+        return (isinstance(a, tuple) and isinstance(b, tuple) and
+                a[:-1] == b[:-1] and a[-1] < b[-1])
+    return a < b
+
+
+class RecognitionPool:
+    def __init__(self, workers=None, slots=None, slot_bytes=8 * 1024 * 1024, pad=0.25):
+        self.workers = workers or os.cpu_count() or 1
+        self.slot_bytes = slot_bytes
+        self.pad = pad
+        slots = slots or 2 * self.workers
+        self._shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        # Fork where available: workers inherit the loaded modules instead of
+        # re-importing the main script.
+        method = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        self._pool = mp.get_context(method).Pool(self.workers, initializer=_init_worker,
+                                                 initargs=(self._shm.name,))
+        self._cond = threading.Condition()
+        self._free = list(range(slots))
+        self._results = {}
+        # Submit to result, as seen by the caller: queueing plus the worker's encode
+        self._embed_time = metrics.stage_histogram("embed")
+        # Stats
+        self.submitted = 0
+        self.rejected = 0
+
+    def submit(self, seq, frame, locations):
+        """Queue the faces at `locations` of BGR `frame` as frame number `seq`.
+
+        Returns False without queueing anything when every slot is busy, so
+        the caller can drop or retry instead of piling up work.
+        """
+        with self._cond:
+            if not self._free:
+                self.rejected += 1
+                return False
+            slot = self._free.pop()
+        base = slot * self.slot_bytes
+        try:
+            crops = self._copy_crops(base, frame, locations)
+        except Exception:
+            # A bad frame must not leak its slot: the pool has only a few
+            with self._cond:
+                self._free.append(slot)
+                self._cond.notify_all()
+            raise
+        self.submitted += 1
+        start = tracing.now()
+        args = tracing.frame_args(tracing.TRACER.current())
+        self._pool.apply_async(_encode_crops, (base, crops),
+                               callback=lambda encodings: self._done(seq, slot, encodings,
+                                                                     start, args),
+                               error_callback=lambda e: self._done(seq, slot, [None] * len(crops),
+                                                                   start, args))
+        return True
+
+    def _copy_crops(self, base, frame, locations):
+        height, width = frame.shape[:2]
+        offset = 0
+        crops = []
+        for (top, right, bottom, left) in locations:
+            # Pad the box so the landmark model sees the whole face
+            ph, pw = int((bottom - top) * self.pad), int((right - left) * self.pad)
+            y0, y1 = max(top - ph, 0), min(bottom + ph, height)
+            x0, x1 = max(left - pw, 0), min(right + pw, width)
+            crop = frame[y0:y1, x0:x1]
+            if offset + crop.nbytes > self.slot_bytes:
+                crops.append(None)
+                continue
+            dst = np.ndarray(crop.shape, dtype=np.uint8, buffer=self._shm.buf, offset=base + offset)
+            dst[...] = crop
+            crops.append((offset, crop.shape, (top - y0, right - x0, bottom - y0, left - x0)))
+            offset += crop.nbytes
+        return crops
+
+    def _done(self, seq, slot, encodings, start, args):
+        end = tracing.now()
+        self._embed_time.observe(end - start)
+        tracing.TRACER.span("embed", start, end, args, thread="recognition-pool")
+        with self._cond:
+            self._free.append(slot)
+            self._results[seq] = encodings
+            self._cond.notify_all()
+
+    def ready(self, seq):
+        with self._cond:
+            return seq in self._results
+
+    def result(self, seq, timeout=None):
+        """Wait for the encodings of frame `seq`, one per location (None if not found).
+
+        Results of older frames of the same stream that nobody collected are
+        discarded.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: seq in self._results, timeout):
+                raise TimeoutError(f"No recognition result for frame {seq}")
+            for old in [s for s in self._results if _older(s, seq)]:
+                del self._results[old]
+            return self._results.pop(seq)
+
+    def close(self, timeout=5.0):
+        """Let the workers finish the queued faces, then stop them.
+
+        Call once nothing submits any more; workers still busy after
+        `timeout` seconds are terminated.
+        """
+        self._pool.close()
+        joiner = threading.Thread(target=self._pool.join, name="recognition-pool-join", daemon=True)
+        joiner.start()
+        joiner.join(timeout)
+        if joiner.is_alive():
+            self._pool.terminate()
+            joiner.join(timeout)
+        self._shm.close()
+        self._shm.unlink()